@@ -1,7 +1,7 @@
 # backend/config.py
 
 # Top 100 Most Popular Stocks (S&P 100 + Popular Growth/Tech Stocks)
-SUPPORTED_TICKERS = [
+SUPPORTED_TICKERS = (
     # Mega Cap Tech (FAANG+)
     "AAPL", "MSFT", "GOOGL", "GOOG", "AMZN", "META", "NVDA", "TSLA",
     
@@ -35,11 +35,14 @@ SUPPORTED_TICKERS = [
     
     # Semiconductors
     "TSM", "ASML", "MU", "AMAT", "LRCX", "KLAC", "ADI"
-]
+)
+
+# Hashed view for O(1) membership checks (the tuple keeps prompt ordering)
+SUPPORTED_TICKERS_SET = frozenset(SUPPORTED_TICKERS)
 
 def is_ticker_supported(ticker: str) -> bool:
     """Check if we support this ticker"""
-    return ticker.upper() in SUPPORTED_TICKERS
+    return ticker.upper() in SUPPORTED_TICKERS_SET
 
 
 def get_supported_count() -> int:
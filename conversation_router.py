@@ -9,8 +9,9 @@
 from __future__ import annotations
 
 import re
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
 
 
 # -----------------------------
@@ -25,6 +26,17 @@ class FollowupAction:
     query: str  # explicit query to run if selected
     keywords: Tuple[str, ...] = ()  # optional keyword hints
 
+    # Token sets used for scoring; derived once at construction, never per message
+    id_toks: FrozenSet[str] = field(init=False, repr=False, compare=False)
+    label_toks: FrozenSet[str] = field(init=False, repr=False, compare=False)
+    keyword_toks: Tuple[FrozenSet[str], ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # frozen dataclass: bypass __setattr__ for the derived fields
+        object.__setattr__(self, "id_toks", frozenset(_IDTOK_RE.findall((self.id or "").lower())))
+        object.__setattr__(self, "label_toks", frozenset(_tokens(self.label or "")))
+        object.__setattr__(self, "keyword_toks", tuple(frozenset(_tokens(kw)) for kw in self.keywords or ()))
+
 
 @dataclass(frozen=True)
 class FollowupResolution:
@@ -40,21 +52,53 @@ class FollowupResolution:
 # Normalization utilities
 # -----------------------------
 
-_WORD_RE = re.compile(r"[a-z0-9']+")
+_PUNCT_RE = re.compile(r"[^a-z0-9'\s]+")
+_WS_RE = re.compile(r"\s+")
+_OPTION_RE = re.compile(r"\b(option|choice)\s*(\d)\b")
+_IDTOK_RE = re.compile(r"[a-z0-9]+")
+
+# Characters that can survive normalization; used to skip re-normalizing clean text
+_CLEAN_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789' ")
+
+# ASCII normalization table: A-Z -> a-z, keep [a-z0-9'], everything else -> space
+_ASCII_NORMALIZE = str.maketrans({
+    c: (c.lower() if c.isalnum() or c == "'" else " ")
+    for c in map(chr, range(128))
+})
+
+def _is_normalized(s: str) -> bool:
+    return (
+        s.isascii()
+        and _CLEAN_CHARS.issuperset(s)
+        and "  " not in s
+        and not s.startswith(" ")
+        and not s.endswith(" ")
+    )
 
+@lru_cache(maxsize=1024)
 def _normalize_text(s: str) -> str:
-    s = (s or "").strip().lower()
+    if not s:
+        return ""
+    # fast path: already normalized (e.g. re-tokenizing a normalized string)
+    if _is_normalized(s):
+        return s
+    if s.isascii():
+        # one C pass: lowercase, punctuation/whitespace -> space; split/join squeezes
+        return " ".join(s.translate(_ASCII_NORMALIZE).split())
+    s = s.strip().lower()
     # unify common apostrophes
     s = s.replace("’", "'")
     # drop noisy punctuation to spaces
-    s = re.sub(r"[^a-z0-9'\s]+", " ", s)
+    s = _PUNCT_RE.sub(" ", s)
     # squeeze spaces
-    s = re.sub(r"\s+", " ", s).strip()
+    s = _WS_RE.sub(" ", s).strip()
     return s
 
-def _tokens(s: str) -> List[str]:
-    s = _normalize_text(s)
-    return _WORD_RE.findall(s)
+@lru_cache(maxsize=1024)
+def _tokens(s: str) -> Tuple[str, ...]:
+    # normalized text is only [a-z0-9'] runs separated by single spaces
+    # (tuple so the cached value can't be mutated by callers)
+    return tuple(_normalize_text(s).split())
 
 
 # -----------------------------
@@ -80,10 +124,9 @@ def is_ack_or_continue(user_text: str) -> bool:
         return False
     if t in _ACK_SINGLETONS:
         return True
-    # Check startswith common acceptance prefixes
-    for p in _ACK_PREFIXES:
-        if t.startswith(p):
-            return True
+    # Check startswith common acceptance prefixes (single C-level scan over the tuple)
+    if t.startswith(_ACK_PREFIXES):
+        return True
     # Heuristic: very short + contains acceptance token
     toks = _tokens(t)
     if len(toks) <= 4 and any(x in ("yes", "yeah", "yep", "sure", "ok", "okay", "alright") for x in toks):
@@ -103,46 +146,82 @@ _ORDINAL_MAP = {
 }
 
 def _ordinal_pick(user_text: str) -> Optional[int]:
-    t = _tokens(user_text)
-    for w in t:
+    t = _normalize_text(user_text)
+    for w in t.split():
         if w in _ORDINAL_MAP:
             return _ORDINAL_MAP[w]
     # also match "option 1", "choice 2"
-    m = re.search(r"\b(option|choice)\s*(\d)\b", _normalize_text(user_text))
+    m = _OPTION_RE.search(t)
     if m:
         idx = int(m.group(2)) - 1
         if idx >= 0:
             return idx
     return None
 
-def _score_action_match(user_text: str, action: FollowupAction) -> int:
+@dataclass(frozen=True)
+class _ActionMasks:
+    """An action's token sets packed as int bit-sets over a shared vocabulary."""
+    id_mask: int
+    label_mask: int
+    keyword_masks: Tuple[int, ...]
+    union_mask: int  # every token the action can score on
+
+def _build_token_masks(actions: List[FollowupAction]) -> Tuple[Dict[str, int], List[_ActionMasks]]:
     """
-    Deterministic keyword scoring:
+    Assign every token seen in the actions a bit index and pack each action's
+    token sets into ints, so scoring is AND + popcount instead of set building.
+    """
+    token_bit: Dict[str, int] = {}
+
+    def pack(toks: FrozenSet[str]) -> int:
+        m = 0
+        for tok in toks:
+            m |= 1 << token_bit.setdefault(tok, len(token_bit))
+        return m
+
+    masks: List[_ActionMasks] = []
+    for a in actions:
+        id_mask = pack(a.id_toks)
+        label_mask = pack(a.label_toks)
+        keyword_masks = tuple(pack(k) for k in a.keyword_toks)
+        union_mask = id_mask | label_mask
+        for km in keyword_masks:
+            union_mask |= km
+        masks.append(_ActionMasks(id_mask, label_mask, keyword_masks, union_mask))
+    return token_bit, masks
+
+def _message_mask(utoks: FrozenSet[str], token_bit: Dict[str, int]) -> int:
+    """Pack the user's tokens; tokens outside the action vocabulary can't score."""
+    m = 0
+    for tok in utoks:
+        bit = token_bit.get(tok)
+        if bit is not None:
+            m |= 1 << bit
+    return m
+
+def _score_action_match(umask: int, masks: _ActionMasks) -> int:
+    """
+    Deterministic keyword scoring against the user's packed message tokens:
     - match action.id tokens
     - match action.keywords
     - match label tokens
     """
-    utoks = set(_tokens(user_text))
-    if not utoks:
+    # no shared token at all: every term below would be zero
+    if not (umask & masks.union_mask):
         return 0
 
-    score = 0
-
     # action.id tokens (split on non-alnum / underscores)
-    id_toks = set(re.findall(r"[a-z0-9]+", (action.id or "").lower()))
-    score += 4 * len(utoks.intersection(id_toks))
+    score = 4 * (umask & masks.id_mask).bit_count()
 
     # explicit keywords (strong signal)
-    for kw in action.keywords or ():
-        kw_toks = set(_tokens(kw))
-        if kw_toks and kw_toks.issubset(utoks):
+    for kw_mask in masks.keyword_masks:
+        if kw_mask and (umask & kw_mask) == kw_mask:
             score += 10
         else:
-            score += 3 * len(utoks.intersection(kw_toks))
+            score += 3 * (umask & kw_mask).bit_count()
 
     # label tokens (weak signal)
-    label_toks = set(_tokens(action.label or ""))
-    score += 2 * len(utoks.intersection(label_toks))
+    score += 2 * (umask & masks.label_mask).bit_count()
 
     return score
 
@@ -160,25 +239,32 @@ def _load_actions_from_memory(last_context: Dict[str, Any]) -> Tuple[List[Follow
       ]
       last_context["default_action_id"] = "..."
     """
-    actions_raw = (last_context or {}).get("next_actions") or []
-    default_id = (last_context or {}).get("default_action_id")
+    ctx = last_context or {}
+    actions_raw = ctx.get("next_actions") or []
+    default_raw = ctx.get("default_action_id")
 
     actions: List[FollowupAction] = []
     for a in actions_raw:
         if not isinstance(a, dict):
             continue
-        aid = str(a.get("id") or "").strip()
-        label = str(a.get("label") or "").strip()
-        query = str(a.get("query") or "").strip()
+        aid = a.get("id")
+        query = a.get("query")
+        if not aid or not query:
+            continue
+        aid = str(aid).strip()
+        query = str(query).strip()
         if not aid or not query:
             continue
-        kws = a.get("keywords") or []
+        label = a.get("label")
+        label = str(label).strip() if label else ""
+        kws = a.get("keywords") or ()
         if isinstance(kws, str):
-            kws = [kws]
-        keywords = tuple(str(x).strip() for x in kws if str(x).strip())
+            kws = (kws,)
+        keywords = tuple(k for k in (str(x).strip() for x in kws) if k)
         actions.append(FollowupAction(id=aid, label=label, query=query, keywords=keywords))
 
     # If default_id missing but there are actions, choose first as default.
+    default_id = default_raw
     if (not default_id) and actions:
         default_id = actions[0].id
 
@@ -209,10 +295,17 @@ def resolve_followup(user_text: str, last_context: Dict[str, Any]) -> FollowupRe
         )
 
     # 2) Keyword-based selection
-    scored = [(a, _score_action_match(user_text, a)) for a in actions]
-    scored.sort(key=lambda x: x[1], reverse=True)
-    best, best_score = scored[0]
-    second_score = scored[1][1] if len(scored) > 1 else 0
+    token_bit, masks = _build_token_masks(actions)
+    umask = _message_mask(frozenset(_tokens(user_text)), token_bit)
+    # Single pass for the top two scores (ties keep the earlier action, as a stable sort would)
+    best, best_score, second_score = actions[0], -1, -1
+    for a, m in zip(actions, masks):
+        sc = _score_action_match(umask, m)
+        if sc > best_score:
+            best, second_score, best_score = a, best_score, sc
+        elif sc > second_score:
+            second_score = sc
+    second_score = max(second_score, 0)  # single action: no runner-up
 
     # If strong match and clear margin, pick it
     if best_score >= 8 and best_score >= (second_score + 3):
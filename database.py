@@ -1,12 +1,17 @@
 # backend/database.py
 
 import sqlite3
-import json
+import asyncio
+import atexit
+import threading
+import zlib
 from datetime import datetime, timedelta
 from typing import Dict, Any
 import os
 from pathlib import Path
 
+import json_utils
+
 # Database file path
 # Use persistent volume on Railway, fallback to local for development
 if os.getenv("RAILWAY_VOLUME_MOUNT_PATH"):
@@ -25,12 +30,73 @@ FRESHNESS = {
     'historical': timedelta(days=365*10)    # Basically never expire (10 years)
 }
 
+# Long-horizon payloads (articles, historical series) are zlib-compressed on
+# write so rows span fewer pages. Compressed blobs carry a 1-byte marker;
+# plain JSON never starts with it, so uncompressed and legacy rows read as-is.
+_COMPRESSED_TYPES = frozenset({'historical', 'weekly', 'monthly', 'articles'})
+_COMPRESS_MIN_BYTES = 512
+_ZLIB_MARKER = b"\x01"
+
+def _encode_payload(data_type: str, data: dict) -> bytes:
+    """Serialize a cache payload, compressing it for long-horizon data types"""
+    raw = json_utils.dumps(data)
+    # data types are keyed like 'historical_1y' / 'articles_7days'
+    if len(raw) >= _COMPRESS_MIN_BYTES and data_type.split('_', 1)[0] in _COMPRESSED_TYPES:
+        return _ZLIB_MARKER + zlib.compress(raw, 3)
+    return raw
+
+def _decode_payload(blob) -> dict:
+    """Inverse of _encode_payload (also accepts legacy TEXT rows)"""
+    if isinstance(blob, bytes) and blob[:1] == _ZLIB_MARKER:
+        blob = zlib.decompress(blob[1:])
+    return json_utils.loads(blob)
+
+# Hot-path SQL kept as module constants so the identical text hits sqlite3's
+# per-connection prepared statement cache. (ticker, data_type) lookups are
+# served by the table's composite PRIMARY KEY index.
+_SELECT_CACHE_SQL = "SELECT data, timestamp FROM cache WHERE ticker = ? AND data_type = ?"
+_WRITE_CACHE_SQL = "INSERT OR REPLACE INTO cache (ticker, data_type, data, timestamp) VALUES (?, ?, ?, ?)"
+
+# One long-lived connection per thread instead of a connect/close per query
+_tls = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+
 def _get_db():
-    """Get database connection"""
+    """Get this thread's database connection, opening it on first use"""
+    conn = getattr(_tls, "conn", None)
+    if conn is not None:
+        return conn
+
     # Ensure directory exists
     db_dir = DB_PATH.parent
     db_dir.mkdir(parents=True, exist_ok=True)
-    return sqlite3.connect(DB_PATH)
+
+    # Autocommit mode: every statement here is a self-contained write
+    conn = sqlite3.connect(
+        DB_PATH, check_same_thread=False, isolation_level=None, cached_statements=256
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-8000")  # ~8 MB page cache
+
+    _tls.conn = conn
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+def _close_all():
+    """Close every pooled connection (registered with atexit)"""
+    with _connections_lock:
+        while _connections:
+            try:
+                _connections.pop().close()
+            except Exception:
+                pass
+
+atexit.register(_close_all)
 
 def init_database():
     """Initialize the cache database and create tables if they don't exist"""
@@ -41,14 +107,22 @@ def init_database():
         CREATE TABLE IF NOT EXISTS cache (
             ticker TEXT NOT NULL,
             data_type TEXT NOT NULL,
-            data TEXT NOT NULL,
+            data BLOB NOT NULL,
             timestamp TEXT NOT NULL,
             PRIMARY KEY (ticker, data_type)
         )
     """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS usage_tracking (
+            identifier TEXT PRIMARY KEY,
+            count INTEGER DEFAULT 0,
+            first_used TEXT,
+            last_used TEXT,
+            is_paid BOOLEAN DEFAULT 0
+        )
+    """)
     
-    conn.commit()
-    conn.close()
     print(f"✓ Database initialized: {DB_PATH}")
 
 def track_usage(identifier: str) -> Dict[str, Any]:
@@ -58,47 +132,19 @@ def track_usage(identifier: str) -> Dict[str, Any]:
     """
     conn = _get_db()
     cursor = conn.cursor()
+    now = datetime.now().isoformat()
     
-    # Create usage table if not exists
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS usage_tracking (
-            identifier TEXT PRIMARY KEY,
-            count INTEGER DEFAULT 0,
-            first_used TEXT,
-            last_used TEXT,
-            is_paid BOOLEAN DEFAULT 0
-        )
-    ''')
-    
-    # Get current usage
+    # Insert on first use, otherwise increment - one statement either way
     cursor.execute(
-        'SELECT count, is_paid FROM usage_tracking WHERE identifier = ?',
-        (identifier,)
+        '''INSERT INTO usage_tracking 
+           (identifier, count, first_used, last_used, is_paid) 
+           VALUES (?, 1, ?, ?, 0)
+           ON CONFLICT(identifier) DO UPDATE
+           SET count = count + 1, last_used = excluded.last_used
+           RETURNING count, is_paid''',
+        (identifier, now, now)
     )
-    row = cursor.fetchone()
-    
-    if row:
-        count, is_paid = row
-        # Increment count
-        cursor.execute(
-            '''UPDATE usage_tracking 
-               SET count = count + 1, last_used = ? 
-               WHERE identifier = ?''',
-            (datetime.now().isoformat(), identifier)
-        )
-        count += 1
-    else:
-        # First use
-        cursor.execute(
-            '''INSERT INTO usage_tracking 
-               (identifier, count, first_used, last_used, is_paid) 
-               VALUES (?, 1, ?, ?, 0)''',
-            (identifier, datetime.now().isoformat(), datetime.now().isoformat())
-        )
-        count = 1
-        is_paid = False
-    
-    conn.commit()
+    count, is_paid = cursor.fetchone()
     
     FREE_LIMIT = 5
     limit_hit = count > FREE_LIMIT and not is_paid
@@ -114,6 +160,7 @@ def mark_user_as_paid(identifier: str) -> bool:
     """Mark a user as having paid subscription"""
     conn = _get_db()
     cursor = conn.cursor()
+    now = datetime.now().isoformat()
     
     cursor.execute(
         'UPDATE usage_tracking SET is_paid = 1 WHERE identifier = ?',
@@ -126,13 +173,20 @@ def mark_user_as_paid(identifier: str) -> bool:
             '''INSERT INTO usage_tracking 
                (identifier, count, first_used, last_used, is_paid) 
                VALUES (?, 0, ?, ?, 1)''',
-            (identifier, datetime.now().isoformat(), datetime.now().isoformat())
+            (identifier, now, now)
         )
     
-    conn.commit()
     print(f"✓ Marked {identifier} as paid user")
     return True
 
+# Async entry points for the API: the write runs on a worker thread (each
+# has its own pooled connection) so the event loop never waits on SQLite.
+async def track_usage_async(identifier: str) -> Dict[str, Any]:
+    return await asyncio.to_thread(track_usage, identifier)
+
+async def mark_user_as_paid_async(identifier: str) -> bool:
+    return await asyncio.to_thread(mark_user_as_paid, identifier)
+
 def get_cached_data(ticker: str, data_type: str) -> dict:
     """
     Get cached data if still fresh.
@@ -146,16 +200,7 @@ def get_cached_data(ticker: str, data_type: str) -> dict:
     """
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT data, timestamp FROM cache 
-            WHERE ticker = ? AND data_type = ?
-        """, (ticker.upper(), data_type))
-        
-        row = cursor.fetchone()
-        conn.close()
+        row = _get_db().execute(_SELECT_CACHE_SQL, (ticker.upper(), data_type)).fetchone()
         
         if not row:
             return None
@@ -166,7 +211,7 @@ def get_cached_data(ticker: str, data_type: str) -> dict:
         
         # Check if still fresh
         if age < FRESHNESS.get(data_type, timedelta(days=1)):
-            return json.loads(data)
+            return _decode_payload(data)
         
         return None  # Stale, need to refetch
         
@@ -186,16 +231,10 @@ def cache_data(ticker: str, data_type: str, data: dict):
     """
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT OR REPLACE INTO cache (ticker, data_type, data, timestamp)
-            VALUES (?, ?, ?, ?)
-        """, (ticker.upper(), data_type, json.dumps(data), datetime.now().isoformat()))
-        
-        conn.commit()
-        conn.close()
+        _get_db().execute(
+            _WRITE_CACHE_SQL,
+            (ticker.upper(), data_type, _encode_payload(data_type, data), datetime.now().isoformat())
+        )
         
     except Exception as e:
         print(f"⚠ Cache write error: {e}")
@@ -211,7 +250,7 @@ def clear_cache(ticker: str = None, data_type: str = None):
     """
     
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = _get_db()
         cursor = conn.cursor()
         
         if ticker and data_type:
@@ -228,8 +267,6 @@ def clear_cache(ticker: str = None, data_type: str = None):
             cursor.execute("DELETE FROM cache")
             print("✓ Cleared entire cache")
         
-        conn.commit()
-        conn.close()
         
     except Exception as e:
         print(f"⚠ Cache clear error: {e}")
@@ -239,7 +276,7 @@ def get_cache_stats():
     """Get statistics about cached data"""
     
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = _get_db()
         cursor = conn.cursor()
         
         cursor.execute("SELECT COUNT(*) FROM cache")
@@ -251,8 +288,6 @@ def get_cache_stats():
         cursor.execute("SELECT data_type, COUNT(*) FROM cache GROUP BY data_type")
         by_type = cursor.fetchall()
         
-        conn.close()
-        
         return {
             "total_entries": total,
             "by_ticker": dict(by_ticker),
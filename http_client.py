@@ -0,0 +1,63 @@
+# backend/http_client.py
+# Shared outbound HTTP client so every Alpha Vantage / Brave call
+# reuses pooled keep-alive connections instead of a fresh TCP+TLS handshake.
+
+from typing import Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_TIMEOUT_SECONDS = 10
+
+# HTTP/2 lets the concurrent quote/company/history requests to one host share
+# a single multiplexed connection. Needs the h2 package (httpx[http2]).
+try:
+    import h2  # noqa: F401
+    HTTP2_ENABLED = True
+except ImportError:  # pragma: no cover - h2 comes with httpx[http2] in requirements.txt
+    HTTP2_ENABLED = False
+
+_async_client: Optional[httpx.AsyncClient] = None
+_session: Optional[requests.Session] = None
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide requests.Session for the sync call paths."""
+    global _session
+    if _session is None:
+        # Retry transient upstream failures with backoff; after the last try
+        # the response is returned as-is so raise_for_status() still applies
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        )
+        session = requests.Session()
+        session.headers.update({"Accept-Encoding": "gzip", "Connection": "keep-alive"})
+        session.mount("https://", HTTPAdapter(pool_connections=20, pool_maxsize=50, max_retries=retry))
+        _session = session
+    return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the process-wide async client, creating it on first use."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            http2=HTTP2_ENABLED,
+            timeout=HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _async_client
+
+
+async def aclose_async_client() -> None:
+    """Close the async client (called on app shutdown)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
@@ -5,7 +5,9 @@ Fail-closed: Returns success=False if confidence < 70%
 """
 
 import os
-import json
+import re
+import threading
+from collections import OrderedDict
 from typing import Dict, Optional
 from anthropic import Anthropic
 from dotenv import load_dotenv
@@ -20,7 +22,11 @@ client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent))
-from config import SUPPORTED_TICKERS, is_ticker_supported
+from config import SUPPORTED_TICKERS, SUPPORTED_TICKERS_SET, is_ticker_supported
+import json_utils
+
+# JSON body inside an optional ```json ... ``` fence in the model's reply
+_FENCE_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.S)
 
 
 SYSTEM_PROMPT = """You are a financial intent parser. Extract structured information from user questions about stocks.
@@ -63,31 +69,13 @@ A: {"ticker": null, "query_type": null, "timeframe": null, "confidence": 0}
 """
 
 
-def parse_intent(user_question: str, context: dict = None) -> Dict:
-    """
-    Parse user intent and extract ticker symbols.
-    Now supports MULTI-TICKER comparisons.
-    
-    Returns:
-        {
-            'success': bool,
-            'tickers': List[str],  # Now a LIST (can be 1-3 tickers)
-            'query_type': str,
-            'confidence': int,
-            'error': str
-        }
-    """
-    
-    # Handle follow-up context
-    if context and context.get('last_ticker'):
-        # Check if user is responding to a comparison suggestion
-        if user_question.lower().strip() in ['yes', 'yeah', 'sure', 'yeah sure', 'ok', 'okay']:
-            # This will be handled by fallback handler
-            pass
-    
-    system_prompt = f"""Extract stock ticker symbols and intent from the user's question.
+# Multi-ticker prompt used by parse_intent. Built once at import so every
+# request sends a byte-identical system prompt.
+_SUPPORTED_TICKERS_PREFIX = ', '.join(SUPPORTED_TICKERS[:20])
 
-SUPPORTED TICKERS (100 total): {', '.join(SUPPORTED_TICKERS[:20])}... and 80 more.
+SYSTEM_PROMPT_V2 = f"""Extract stock ticker symbols and intent from the user's question.
+
+SUPPORTED TICKERS (100 total): {_SUPPORTED_TICKERS_PREFIX}... and 80 more.
 
 CRITICAL: The user may ask about MULTIPLE tickers for comparison.
 Examples:
@@ -116,12 +104,165 @@ CRITICAL:
 - If multiple tickers mentioned → query_type = "comparison"
 - Maximum 3 tickers per comparison
 """
+
+
+# LRU of successful parses keyed on the normalized question. Only confident
+# results are stored so unclear questions still get a fresh model call.
+INTENT_CACHE_SIZE = 2048
+_intent_cache: "OrderedDict[str, Dict]" = OrderedDict()
+_intent_cache_lock = threading.Lock()  # parse_intent runs in worker threads
+
+
+def _intent_cache_key(user_question: str) -> str:
+    return " ".join(user_question.lower().split())
+
+
+def _copy_intent(intent: Dict) -> Dict:
+    # callers get their own dict/list so the cached entry can't be mutated
+    return {**intent, 'tickers': list(intent.get('tickers', []))}
+
+
+# -----------------------------
+# Rule-based fast path
+# -----------------------------
+# Unambiguous questions ("NVDA vs AMD", "Should I buy TSLA?", "AAPL") are
+# classified locally; anything else falls through to Claude.
+
+# Case-sensitive on purpose: only explicit uppercase symbols count. Longest
+# first so the alternation can't stop at a shorter symbol.
+_TICKER_RE = re.compile(
+    r"\b(" + "|".join(sorted(SUPPORTED_TICKERS, key=len, reverse=True)) + r")\b"
+)
+
+# Symbols that double as common words/abbreviations ("NOW", "AI", "T") - too
+# easy to misread, so their presence sends the question to Claude.
+_AMBIGUOUS_TICKERS = frozenset(
+    {t for t in SUPPORTED_TICKERS if len(t) == 1}
+    | {"AI", "NOW", "NET", "LOW", "COST", "TEAM", "DIS", "MA", "MS", "DE", "GE", "HD"}
+)
+
+_QUERY_TYPE_PATTERNS = (
+    ("comparison", re.compile(r"\b(vs\.?|versus|compare[sd]?|comparison|against)\b")),
+    ("buy_recommendation", re.compile(r"\b(buy|sell|should i|worth (buying|it)|invest in)\b")),
+    ("outlook", re.compile(r"\b(outlook|future|forecast|long[- ]term|prospects?)\b")),
+    ("historical_performance", re.compile(r"\b(performed|history|historical(ly)?|past (week|month|year))\b")),
+    ("current_performance", re.compile(r"\b(today|right now|doing|happening|moving|how'?s|how is)\b")),
+)
+
+_TIMEFRAME_PATTERNS = (
+    ("this_week", re.compile(r"\b(this|past|last) week\b")),
+    ("this_month", re.compile(r"\b(this|past|last) month\b")),
+    ("this_year", re.compile(r"\b(this|past|last) year\b|\bytd\b")),
+    ("long_term", re.compile(r"\b(long[- ]term|years)\b")),
+    ("today", re.compile(r"\b(today|right now)\b")),
+)
+
+# Text left after removing tickers/punctuation that still counts as "bare ticker"
+_BARE_TICKER_RE = re.compile(r"^[\s$?!.,]*$")
+
+FAST_PATH_CONFIDENCE = 85
+
+
+def _fast_parse_intent(user_question: str) -> Optional[Dict]:
+    """
+    Classify simple questions without an API call.
+    Returns a success intent, or None when Claude should decide.
+    """
+    tickers = list(dict.fromkeys(_TICKER_RE.findall(user_question)))
+    if not tickers or len(tickers) > 3:
+        return None
+    if any(t in _AMBIGUOUS_TICKERS for t in tickers):
+        return None
+    
+    q = user_question.lower()
+    matched = [qt for qt, pattern in _QUERY_TYPE_PATTERNS if pattern.search(q)]
+    
+    if len(tickers) > 1:
+        # Multiple tickers always means a comparison
+        query_type = "comparison"
+    elif matched:
+        # Single ticker: exactly one unambiguous category, and "compare X to
+        # its peers" needs Claude to work out the peers
+        if len(matched) > 1 or matched[0] == "comparison":
+            return None
+        query_type = matched[0]
+    elif _BARE_TICKER_RE.match(_TICKER_RE.sub(" ", user_question)):
+        query_type = "current_performance"
+    else:
+        return None
+    
+    timeframe = next((tf for tf, pattern in _TIMEFRAME_PATTERNS if pattern.search(q)), None)
+    if timeframe is None:
+        timeframe = "long_term" if query_type == "outlook" else "today"
+    
+    return {
+        'success': True,
+        'tickers': tickers,
+        'query_type': query_type,
+        'timeframe': timeframe,
+        'confidence': FAST_PATH_CONFIDENCE
+    }
+
+
+def parse_intent(user_question: str, context: dict = None) -> Dict:
+    """
+    Parse user intent and extract ticker symbols.
+    Now supports MULTI-TICKER comparisons.
+    
+    Returns:
+        {
+            'success': bool,
+            'tickers': List[str],  # Now a LIST (can be 1-3 tickers)
+            'query_type': str,
+            'confidence': int,
+            'error': str
+        }
+    """
+    
+    # Handle follow-up context
+    if context and context.get('last_ticker'):
+        # Check if user is responding to a comparison suggestion
+        if user_question.lower().strip() in ['yes', 'yeah', 'sure', 'yeah sure', 'ok', 'okay']:
+            # This will be handled by fallback handler
+            pass
+    
+    fast = _fast_parse_intent(user_question)
+    if fast is not None:
+        print(f"✓ Intent fast path: {fast['tickers']} - {fast['query_type']}")
+        return fast
+    
+    # Context-dependent follow-ups bypass the cache
+    use_cache = not (context and context.get('last_ticker'))
+    key = _intent_cache_key(user_question)
+    
+    if use_cache:
+        with _intent_cache_lock:
+            cached = _intent_cache.get(key)
+            if cached is not None:
+                _intent_cache.move_to_end(key)
+        if cached is not None:
+            print(f"✓ Intent cache hit: {cached['tickers']}")
+            return _copy_intent(cached)
+    
+    result = _parse_intent_uncached(user_question)
+    
+    if use_cache and result.get('success'):
+        with _intent_cache_lock:
+            _intent_cache[key] = _copy_intent(result)
+            if len(_intent_cache) > INTENT_CACHE_SIZE:
+                _intent_cache.popitem(last=False)
+    
+    return result
+
+
+def _parse_intent_uncached(user_question: str) -> Dict:
+    """Call Claude to extract tickers/intent (no caching)."""
     
     try:
         message = client.messages.create(
             model="claude-sonnet-4-20250514",
             max_tokens=300,
-            system=system_prompt,
+            system=SYSTEM_PROMPT_V2,
             messages=[
                 {"role": "user", "content": f"Question: {user_question}"}
             ]
@@ -130,12 +271,10 @@ CRITICAL:
         response_text = message.content[0].text
         
         # Parse JSON (handle markdown code blocks)
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0]
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0]
+        m = _FENCE_RE.search(response_text)
+        payload = m.group(1) if m else response_text.strip()
         
-        result = json.loads(response_text.strip())
+        result = json_utils.loads(payload)
         
         # Validate tickers (convert single ticker to list if needed)
         if isinstance(result.get('tickers'), str):
@@ -145,7 +284,7 @@ CRITICAL:
         confidence = result.get('confidence', 0)
         
         # Validate all tickers are supported
-        valid_tickers = [t.upper() for t in tickers if t.upper() in SUPPORTED_TICKERS]
+        valid_tickers = [u for t in tickers if (u := str(t).upper()) in SUPPORTED_TICKERS_SET]
         
         if not valid_tickers:
             return {
@@ -0,0 +1,37 @@
+# backend/json_utils.py
+# ASCII-only. JSON encode/decode helpers: orjson when installed, stdlib json otherwise.
+
+import hashlib
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def dumps(data: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON from bytes or str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def digest(data: Any) -> str:
+    """Stable 128-bit hex digest of a JSON-able value (dict keys sorted).
+
+    Used for cache keys; values JSON can't encode fall back to str().
+    """
+    if orjson is not None:
+        raw = orjson.dumps(data, default=str, option=orjson.OPT_SORT_KEYS)
+    else:
+        raw = json.dumps(data, default=str, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
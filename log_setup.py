@@ -0,0 +1,48 @@
+# backend/log_setup.py
+# Logging for the API. Request handlers only put records on an in-memory
+# queue; a QueueListener thread does the actual stdout writes.
+
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging() -> None:
+    """Route the "finance" logger through a queue; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    logger = logging.getLogger("finance")
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Child of the "finance" logger, e.g. get_logger("api") -> finance.api."""
+    return logging.getLogger(f"finance.{name}")
@@ -1,32 +1,202 @@
 # backend/main.py
 # ASCII-only. V2.0 - Simplified conversation flow with clickable follow-ups
 
+import asyncio
+import hashlib
+import os
+import re
+import threading
+from datetime import datetime
+from functools import lru_cache
+
+from anthropic import AsyncAnthropic
+
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
 
 import sys
 from pathlib import Path
-from stripe_handler import create_checkout_session, verify_webhook
-from database import track_usage, mark_user_as_paid
+from stripe_handler import create_checkout_session, verify_webhook, forget_checkout_session
+from database import track_usage_async, mark_user_as_paid_async
 
 # Add backend to path
 sys.path.append(str(Path(__file__).parent))
 
 # Import all our modules
 from intent_parser import parse_intent
-from market_data import get_stock_data
-from web_search import search_stock_articles
-from validator import validate_stock_data
-from response_generator import generate_response, generate_comparison_response
+from market_data import get_stock_data_async, get_current_prices_batch_async
+from web_search import search_stock_articles_async
+from validator import validate_stock_data, confidence_level_for
+from response_generator import (
+    generate_response,
+    generate_response_stream,
+    generate_comparison_response,
+    aclose_async_client as aclose_anthropic_client,
+)
 from database import init_database
+from ttl_cache import TTLCache
+from http_client import get_async_client, aclose_async_client
+import json_utils
+from log_setup import setup_logging, stop_logging, get_logger
+
+logger = get_logger("api")
+
+# Cap on concurrent per-ticker fetches against the upstream APIs
+MAX_CONCURRENT_FETCHES = 8
+_fetch_semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+
+# Answers to general (no-ticker) questions keyed on a hash of the normalized
+# question - repeats like "what should I buy?" skip the model call entirely
+GENERAL_ANSWER_TTL_SECONDS = 1800
+_general_answer_cache = TTLCache(maxsize=256, ttl=GENERAL_ANSWER_TTL_SECONDS)
+
+
+def _general_answer_key(question: str) -> str:
+    normalized = " ".join(question.lower().split())
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+
+# Vocabulary that marks a general question as carrying investment criteria
+_WORD_RE = re.compile(r"[a-z]+")
+_RISK_TERMS = frozenset({
+    'risk', 'risks', 'risky', 'tolerance', 'aggressive', 'conservative',
+    'gamble', 'gambling', 'play with',
+})
+_TIMEFRAME_TERMS = frozenset({
+    'year', 'years', 'yearly', 'month', 'months', 'monthly',
+    'hold', 'holding', 'long term', 'short term',
+})
+
+
+# System prompt for general (no-ticker) questions. Sent as content blocks with
+# the base prompt marked for prompt caching, so repeat calls can reuse the
+# cached prefix; the criteria note goes in its own block after it.
+GENERAL_SYSTEM_PROMPT = """You are a private, internal-use investment reasoning system.
+
+This system operates with access to structured local state, cached market data,
+and precomputed context produced outside the language model.
+
+Your job is to make real investment judgments for a trusted human user.
+Be precise, grounded, and explicit about assumptions and limits.
+
+Core operating philosophy (AUFG-style):
+- evidence before narrative
+- constraints before conclusions
+- uncertainty must be stated explicitly
+- judgments are allowed and expected
+- no fake certainty: risk is time-varying
+
+The user asked a general investing question without specifying a ticker.
+
+Your task:
+Proactively propose a small candidate set and make real judgments.
+Do NOT ask clarifying questions first.
+
+––––––––––––––––––––
+Universe & selection rules (STRICT)
+––––––––––––––––––––
+
+1) Default universe (preferred for demos):
+TSLA, NVDA, AMD, PLTR, COIN, AAPL, MSFT, GOOGL, JPM, JNJ, PG
+
+2) You may deviate from the default universe ONLY if:
+- the user's question implies a specific sector/theme (e.g., "energy", "defense", "dividends")
+- OR the default universe is structurally mismatched to the request
+
+If you deviate:
+- include at most 2 extra tickers
+- and explain the reason in one sentence under "Constraints & rationale".
+
+3) Risk labels are NOT permanent.
+You must classify each ticker into a risk regime based on "right now" conditions:
+- volatility / beta intuition
+- business cyclicality
+- valuation fragility
+- current news/earnings sensitivity (if known)
+If unknown, say unknown.
+
+––––––––––––––––––––
+Output format (STRICT)
+––––––––––––––––––––
+
+1) One short acknowledgment of the user's intent.
+
+2) Section title:
+Candidate set (ranked, judgment-based)
+
+First list the candidates in ranked order (best to worst fit for a generic retail investor),
+then bucket them into three time-varying regimes:
+
+- Higher uncertainty / higher variance outcomes
+- Mid uncertainty / quality compounders or platform leverage
+- Lower uncertainty / cash-flow anchored or defensive characteristics
+
+Important:
+Do NOT imply "low risk forever" — these are current regime labels only.
+
+3) For EACH candidate, include exactly four short bullets:
+
+- Approx price range (rough is acceptable)
+- Why it's attractive right now (your judgment)
+- What must go right (explicit condition)
+- Primary failure mode (how this breaks)
+
+4) Section:
+Key considerations for different investor profiles
+
+In 2–4 sentences:
+Outline which 1–2 names may align with different risk profiles and why,
+given typical constraints (capital size, risk tolerance, time horizon).
+
+Frame as "investors seeking X might consider Y because..." rather than personal recommendations.
+Focus on trade-offs and scenarios, not prescriptive advice.
+
+5) Section:
+Constraints & unknowns
+
+List 2–3 concrete uncertainties that would materially change your judgments
+(e.g., data freshness, earnings timing, macro sensitivity, missing fundamentals, API limits).
+
+If you added tickers outside the default universe, note that here.
+
+––––––––––––––––––––
+Tone constraints
+- calm, analytical, direct
+- no emojis
+- no hype or influencer language
+- no public-facing disclaimers
+"""
+
+_GENERAL_CRITERIA_NOTE = "NOTE: User mentioned investment criteria. Tailor suggestions accordingly."
+
+_GENERAL_SYSTEM = [
+    {"type": "text", "text": GENERAL_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}},
+]
+_GENERAL_SYSTEM_WITH_NOTE = _GENERAL_SYSTEM + [
+    {"type": "text", "text": _GENERAL_CRITERIA_NOTE},
+]
+
+
+# One async Anthropic client for general questions, created on first use so
+# its connection pool is reused and the model call doesn't block the loop
+_anthropic_client: Optional[AsyncAnthropic] = None
+
+
+def _get_anthropic() -> AsyncAnthropic:
+    global _anthropic_client
+    if _anthropic_client is None:
+        _anthropic_client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    return _anthropic_client
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Finance Assistant API",
     description="AI-powered stock analysis with fail-closed confidence scoring",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Enable CORS for frontend
@@ -34,21 +204,46 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=[
     "https://alexandersucala.com",
+    "https://www.alexandersucala.com",
     "https://alexandersucala.github.io",
-    "http://localhost:3000",
-    "*"
+    "http://localhost:3000"
 ],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "stripe-signature"],
+    max_age=86400,  # let browsers cache the preflight for a day
 )
 
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
-    init_database()
-    print("✓ Finance Assistant API started - V2.0")
-    print("✓ Database initialized")
+    setup_logging()
+    # Schema setup runs in the background so uvicorn starts accepting
+    # connections right away; DB-backed endpoints wait on it (_db_ready)
+    app.state.db_init = asyncio.create_task(asyncio.to_thread(init_database))
+    get_async_client()
+    # uvicorn's default loop="auto" runs on uvloop whenever it is installed
+    loop_impl = type(asyncio.get_running_loop()).__module__.split(".")[0]
+    logger.info("✓ Finance Assistant API started - V2.0 (event loop: %s)", loop_impl)
+
+
+async def _db_ready() -> None:
+    """Wait for the startup init_database task (instant once it has finished)."""
+    db_init = getattr(app.state, "db_init", None)
+    if db_init is not None:
+        await db_init
+
+
+def _db_is_ready() -> bool:
+    db_init = getattr(app.state, "db_init", None)
+    return db_init is not None and db_init.done() and not db_init.cancelled() and db_init.exception() is None
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await aclose_async_client()
+    await aclose_anthropic_client()
+    stop_logging()
 
 
 # Request/Response models
@@ -71,6 +266,7 @@ class AnalysisResponse(BaseModel):
 @app.post("/api/stripe-webhook")
 async def stripe_webhook(request: Request):
     """Handle Stripe webhook events"""
+    await _db_ready()
     payload = await request.body()
     sig_header = request.headers.get('stripe-signature')
     
@@ -88,8 +284,9 @@ async def stripe_webhook(request: Request):
         
         if client_reference_id:
             # Mark user as paid
-            mark_user_as_paid(client_reference_id)
-            print(f"✓ User {client_reference_id} subscribed successfully")
+            await mark_user_as_paid_async(client_reference_id)
+            forget_checkout_session(client_reference_id)
+            logger.info("✓ User %s subscribed successfully", client_reference_id)
     
     return {"success": True}
 
@@ -130,185 +327,392 @@ async def ask_question(request: Request, question_data: QuestionRequest):
     - No complex conversation state - each query is independent
     """
     
-    # Get user identifier (IP address)
-    client_ip = request.client.host
-    
-    # Track usage
-    usage = track_usage(client_ip)
-    
-    # Check if limit hit
-    if usage["limit_hit"]:
-        return {
-            "success": False,
-            "confidence": "LOW",
-            "answer": f"You've used all {usage['count']} free queries. Upgrade to Premium for unlimited access at $5/month.",
-            "paywall": True,
-            "usage": usage
-        }
-    
-    # Get question and session from parsed body (not raw request)
-    question = question_data.question.strip()
+    # Get question and session from parsed body (not raw request); reject
+    # bad input before it costs a usage slot
+    question = _clean_question(question_data)
     session_id = question_data.session_id
-    if not question:
-        raise HTTPException(status_code=400, detail="Question cannot be empty")
 
-    print(f"\n{'='*70}")
-    print(f"NEW QUESTION: {question}")
-    print(f"Session: {session_id}")
-    print(f"{'='*70}")
+    # Track usage by user identifier (IP address); stop here if limit hit
+    await _db_ready()
+    paywall = await _check_usage(request.client.host)
+    if paywall:
+        return paywall
+
+    logger.info("NEW QUESTION: %s (session %s)", question, session_id)
 
     try:
         # Step 1: Parse intent
-        print("\n[1/5] Parsing intent...")
-        intent = parse_intent(question)
+        logger.debug("[1/5] Parsing intent...")
+        # parse_intent may make a blocking Claude call - keep it off the event loop
+        intent = await asyncio.to_thread(parse_intent, question)
 
         if not intent.get("success"):
-            print("⚠ Intent unclear, handling as general question...")
+            logger.info("⚠ Intent unclear, handling as general question...")
             return await handle_general_question(question, session_id)
 
         tickers = intent.get("tickers", []) or []
 
         if not tickers:
-            print("⚠ No ticker found, handling as general question...")
+            logger.info("⚠ No ticker found, handling as general question...")
             return await handle_general_question(question, session_id)
 
-        print(f"✓ Intent: {tickers} - {intent.get('query_type')}")
+        logger.info("✓ Intent: %s - %s", tickers, intent.get('query_type'))
 
-        # Step 2: Fetch market data for ALL tickers
-        print(f"\n[2/5] Fetching market data for {len(tickers)} ticker(s)...")
+        return await _analyze_tickers(intent, tickers)
 
-        all_stock_data: Dict[str, Any] = {}
-        for ticker in tickers:
-            stock_data = get_stock_data(ticker, include_historical=True)
-            if stock_data.get("success"):
-                all_stock_data[ticker] = stock_data
-                print(f"  ✓ {ticker} data fetched")
-            else:
-                print(f"  ✗ {ticker} data failed")
-
-        if not all_stock_data:
-            return AnalysisResponse(
-                success=False,
-                error=f"Failed to fetch data for {', '.join(tickers)}. Please check ticker symbols.",
-                ticker=tickers[0] if tickers else None,
-                confidence="LOW",
-                confidence_score=0
-            )
+    except Exception as e:
+        logger.exception("✗ Error processing question: %s", e)
+        
+        return AnalysisResponse(
+            success=False,
+            error=f"An error occurred: {str(e)}",
+            confidence="LOW",
+            confidence_score=0
+        )
 
-        # Step 3: Search articles for ALL tickers
-        print(f"\n[3/5] Searching for articles...")
 
-        all_articles: Dict[str, List[Dict[str, Any]]] = {}
-        for ticker in all_stock_data.keys():
-            articles = search_stock_articles(ticker, days_back=7, max_results=5)
-            all_articles[ticker] = articles
-            print(f"  ✓ {ticker}: {len(articles)} articles")
+@app.post("/api/ask-stream")
+async def ask_question_stream(request: Request, question_data: QuestionRequest):
+    """
+    Same as /api/ask, but as Server-Sent Events. General and single-ticker
+    questions stream the model's text as it is generated ({"delta": ...}
+    events); comparisons are analyzed as usual. Every stream ends with one
+    {"done": true, "response": {...}} event carrying the full /api/ask
+    response body.
+    """
+    
+    question = _clean_question(question_data)
+    session_id = question_data.session_id
 
-        # Step 4: Calculate confidence (aggregate across all tickers)
-        print(f"\n[4/5] Calculating confidence score...")
+    await _db_ready()
+    paywall = await _check_usage(request.client.host)
+    if paywall:
+        return StreamingResponse(_single_event(paywall), media_type="text/event-stream", headers=_SSE_HEADERS)
 
-        confidences: List[int] = []
-        per_ticker_validation: Dict[str, Dict[str, Any]] = {}
+    logger.info("NEW QUESTION (stream): %s (session %s)", question, session_id)
 
-        for ticker in all_stock_data.keys():
-            v = validate_stock_data(all_stock_data[ticker], all_articles.get(ticker, []))
-            per_ticker_validation[ticker] = v
-            confidences.append(int(v.get("confidence_score", 0)))
+    return StreamingResponse(_stream_answer(question), media_type="text/event-stream", headers=_SSE_HEADERS)
 
-        avg_confidence = (sum(confidences) // len(confidences)) if confidences else 0
 
-        if avg_confidence >= 80:
-            overall_confidence = "HIGH"
-        elif avg_confidence >= 50:
-            overall_confidence = "MEDIUM"
-        else:
-            overall_confidence = "LOW"
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
-        print(f"✓ Confidence: {overall_confidence} ({avg_confidence}%)")
 
-        # Step 5: Generate response
-        print(f"\n[5/5] Generating analysis...")
+def _sse(payload: Dict[str, Any]) -> bytes:
+    return b"data: " + json_utils.dumps(payload) + b"\n\n"
 
-        if len(tickers) == 1:
-            ticker = tickers[0]
-            validation = per_ticker_validation.get(ticker) or validate_stock_data(all_stock_data[ticker], all_articles.get(ticker, []))
-            response = generate_response(intent, all_stock_data[ticker], all_articles.get(ticker, []), validation)
-            
-            # Generate suggested follow-ups based on query type
-            suggested_followups = _generate_followup_buttons(ticker, intent.get("query_type"))
-        else:
-            response = generate_comparison_response(intent, all_stock_data, all_articles, overall_confidence, avg_confidence)
-            
-            # Generate comparison follow-ups
-            suggested_followups = _generate_comparison_followup_buttons(tickers)
-
-        if not response.get("success"):
-            return AnalysisResponse(
-                success=False,
-                error=response.get("error", "Failed to generate analysis"),
-                confidence="LOW",
-                confidence_score=0
-            )
 
-        print(f"✓ Analysis generated ({len(response.get('answer',''))} chars)")
-        print("="*70)
+def _done_event(response: Any) -> bytes:
+    if isinstance(response, AnalysisResponse):
+        response = response.model_dump()
+    return _sse({"done": True, "response": response})
 
-        return AnalysisResponse(
-            success=True,
-            answer=response.get("answer"),
-            confidence=response.get("confidence"),
-            confidence_score=response.get("confidence_score"),
-            badge=response.get("badge"),
-            sources=response.get("sources", []),
-            ticker=tickers[0] if len(tickers) == 1 else ', '.join(tickers) if tickers else None,
-            suggested_followups=suggested_followups
-        )
 
+async def _single_event(response: Any) -> AsyncIterator[bytes]:
+    yield _done_event(response)
+
+
+async def _stream_answer(question: str) -> AsyncIterator[bytes]:
+    try:
+        logger.debug("[1/5] Parsing intent...")
+        intent = await asyncio.to_thread(parse_intent, question)
+        tickers = (intent.get("tickers", []) or []) if intent.get("success") else []
+
+        if tickers:
+            logger.info("✓ Intent: %s - %s", tickers, intent.get('query_type'))
+            if len(tickers) == 1:
+                async for event in _stream_ticker_analysis(intent, tickers[0]):
+                    yield event
+            else:
+                yield _done_event(await _analyze_tickers(intent, tickers))
+            return
+    except Exception as e:
+        logger.exception("✗ Error processing question: %s", e)
+        yield _done_event(AnalysisResponse(
+            success=False,
+            error=f"An error occurred: {str(e)}",
+            confidence="LOW",
+            confidence_score=0
+        ))
+        return
+
+    logger.info("⚠ No ticker intent, streaming general answer...")
+    cache_key = _general_answer_key(question)
+    answer = _general_answer_cache.get(cache_key)
+    if answer is not None:
+        logger.info("✓ General answer cache hit")
+        yield _sse({"delta": answer})
+        yield _done_event(_general_answer_response(answer))
+        return
+
+    parts: List[str] = []
+    try:
+        client = _get_anthropic()
+        async with client.messages.stream(
+            model="claude-sonnet-4-20250514",
+            max_tokens=1200,
+            system=_general_system_for(question),
+            messages=[{"role": "user", "content": f"User question: {question}"}]
+        ) as stream:
+            async for text in stream.text_stream:
+                parts.append(text)
+                yield _sse({"delta": text})
     except Exception as e:
-        print(f"✗ Error processing question: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.warning("⚠ Network error or API issue: %s", e)
+        yield _done_event(_general_error_response())
+        return
+
+    answer = "".join(parts)
+    _general_answer_cache.set(cache_key, answer)
+    yield _done_event(_general_answer_response(answer))
+
+
+MAX_QUESTION_CHARS = 2000
+
+
+def _clean_question(question_data: QuestionRequest) -> str:
+    """Stripped question text; 400 if empty, 413 if too long to send to Claude."""
+    question = question_data.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    if len(question) > MAX_QUESTION_CHARS:
+        raise HTTPException(status_code=413, detail=f"Question is too long (max {MAX_QUESTION_CHARS} characters)")
+    return question
+
+
+async def _check_usage(client_ip: str) -> Optional[Dict[str, Any]]:
+    """Count this query; returns the paywall payload if the free limit is used up."""
+    usage = await track_usage_async(client_ip)
+    
+    if usage["limit_hit"]:
+        return {
+            "success": False,
+            "confidence": "LOW",
+            "answer": f"You've used all {usage['count']} free queries. Upgrade to Premium for unlimited access at $5/month.",
+            "paywall": True,
+            "usage": usage
+        }
+    return None
+
+
+async def _analyze_tickers(intent: Dict[str, Any], tickers: List[str]) -> AnalysisResponse:
+    """Steps 2-5 of the ticker flow: fetch, validate and generate the analysis."""
+    inputs = await _analysis_inputs(tickers)
+    if inputs is None:
+        return _no_data_response(tickers)
+    all_stock_data, all_articles, per_ticker_validation, avg_confidence, overall_confidence = inputs
+
+    # Step 5: Generate response (the single-ticker model call blocks, so it runs in a thread)
+    logger.debug("[5/5] Generating analysis...")
+
+    if len(tickers) == 1:
+        ticker = tickers[0]
+        # Validated exactly once, in _process_ticker
+        response = await asyncio.to_thread(
+            generate_response, intent, all_stock_data[ticker], all_articles[ticker], per_ticker_validation[ticker]
+        )
         
+        # Generate suggested follow-ups based on query type
+        suggested_followups = _generate_followup_buttons(ticker, intent.get("query_type"))
+    else:
+        response = await generate_comparison_response(
+            intent, all_stock_data, all_articles, overall_confidence, avg_confidence
+        )
+        
+        # Generate comparison follow-ups
+        suggested_followups = _generate_comparison_followup_buttons(tickers)
+
+    return _analysis_response(response, tickers, suggested_followups)
+
+
+async def _stream_ticker_analysis(intent: Dict[str, Any], ticker: str) -> AsyncIterator[bytes]:
+    """Single-ticker flow for /api/ask-stream: model text as {"delta": ...} events, then done."""
+    inputs = await _analysis_inputs([ticker])
+    if inputs is None:
+        yield _done_event(_no_data_response([ticker]))
+        return
+    all_stock_data, all_articles, per_ticker_validation, _, _ = inputs
+
+    logger.debug("[5/5] Streaming analysis...")
+    events = generate_response_stream(intent, all_stock_data[ticker], all_articles[ticker], per_ticker_validation[ticker])
+    # The Anthropic stream is blocking, so frames are pulled on worker
+    # threads; the lock makes close() wait for a next() still in flight
+    lock = threading.Lock()
+
+    def pull() -> Optional[Dict[str, Any]]:
+        with lock:
+            return next(events, None)
+
+    def close() -> None:
+        with lock:
+            events.close()
+
+    try:
+        while True:
+            event = await asyncio.to_thread(pull)
+            if event is None:
+                return
+            if event.get("done"):
+                suggested_followups = _generate_followup_buttons(ticker, intent.get("query_type"))
+                yield _done_event(_analysis_response(event["response"], [ticker], suggested_followups))
+                return
+            yield _sse({"delta": event["delta"]})
+    finally:
+        # Client disconnect or cancellation: release the Anthropic stream
+        # instead of leaving it open until the generator is collected
+        await asyncio.shield(asyncio.to_thread(close))
+
+
+async def _analysis_inputs(tickers: List[str]) -> Optional[Tuple[Dict[str, Any], Dict[str, List[Dict[str, Any]]], Dict[str, Dict[str, Any]], int, str]]:
+    """
+    Steps 2-4 for every ticker: (all_stock_data, all_articles,
+    per_ticker_validation, avg_confidence, overall_confidence), or None when
+    no ticker returned market data.
+    """
+    # Steps 2-4: per-ticker pipeline (market data -> articles -> validation),
+    # all tickers in flight at once
+    logger.debug("[2-4/5] Fetching data, articles and confidence for %d ticker(s)...", len(tickers))
+
+    # Comparisons quote every ticker from one bulk call, so all of them
+    # report change against the same (daily) previous close
+    quotes: Dict[str, Dict[str, Any]] = {}
+    if len(tickers) > 1:
+        quotes = await get_current_prices_batch_async(tickers)
+
+    # One freshness reference for every ticker in the request
+    now = datetime.now()
+    results = await asyncio.gather(
+        *(_process_ticker(t, now, quotes.get(t.upper())) for t in tickers), return_exceptions=True
+    )
+
+    all_stock_data: Dict[str, Any] = {}
+    all_articles: Dict[str, List[Dict[str, Any]]] = {}
+    per_ticker_validation: Dict[str, Dict[str, Any]] = {}
+    confidences: List[int] = []
+
+    for ticker, result in zip(tickers, results):
+        if isinstance(result, BaseException):
+            logger.warning("  ✗ %s pipeline failed: %s", ticker, result)
+            continue
+        if result is None:
+            continue
+        stock_data, articles, v = result
+        all_stock_data[ticker] = stock_data
+        all_articles[ticker] = articles
+        per_ticker_validation[ticker] = v
+        confidences.append(int(v.get("confidence_score", 0)))
+
+    if not all_stock_data:
+        return None
+
+    avg_confidence = (sum(confidences) // len(confidences)) if confidences else 0
+    overall_confidence = confidence_level_for(avg_confidence)
+
+    logger.info("✓ Confidence: %s (%s%%)", overall_confidence, avg_confidence)
+
+    return all_stock_data, all_articles, per_ticker_validation, avg_confidence, overall_confidence
+
+
+def _no_data_response(tickers: List[str]) -> AnalysisResponse:
+    return AnalysisResponse(
+        success=False,
+        error=f"Failed to fetch data for {', '.join(tickers)}. Please check ticker symbols.",
+        ticker=tickers[0] if tickers else None,
+        confidence="LOW",
+        confidence_score=0
+    )
+
+
+def _analysis_response(response: Dict[str, Any], tickers: List[str], suggested_followups: List[Dict[str, str]]) -> AnalysisResponse:
+    """Turn a response_generator result into the /api/ask body."""
+    if not response.get("success"):
         return AnalysisResponse(
             success=False,
-            error=f"An error occurred: {str(e)}",
+            error=response.get("error", "Failed to generate analysis"),
             confidence="LOW",
             confidence_score=0
         )
 
+    logger.info("✓ Analysis generated (%d chars)", len(response.get('answer') or ''))
+
+    return AnalysisResponse(
+        success=True,
+        answer=response.get("answer"),
+        confidence=response.get("confidence"),
+        confidence_score=response.get("confidence_score"),
+        badge=response.get("badge"),
+        sources=response.get("sources", []),
+        ticker=tickers[0] if len(tickers) == 1 else ', '.join(tickers) if tickers else None,
+        suggested_followups=suggested_followups
+    )
+
+
+async def _process_ticker(
+    ticker: str, now: Optional[datetime] = None, quote: Optional[Dict[str, Any]] = None
+) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]]:
+    """
+    Fetch market data and articles concurrently, then validate - for one ticker.
+    Returns (stock_data, articles, validation), or None if market data failed.
+    """
+    # The article search doesn't need the quote, so its round-trip overlaps
+    # the market-data fetch; it is cancelled if the ticker turns out bad
+    articles_task = asyncio.ensure_future(_search_articles(ticker))
+
+    # market_data serves repeats from its own per-part memory/SQLite tiers
+    try:
+        async with _fetch_semaphore:
+            stock_data = await get_stock_data_async(ticker, include_historical=True, current=quote)
+    except BaseException:
+        articles_task.cancel()
+        raise
+    if not stock_data.get("success"):
+        articles_task.cancel()
+        logger.warning("  ✗ %s data failed", ticker)
+        return None
+    logger.debug("  ✓ %s data fetched", ticker)
+
+    articles = await articles_task
+    logger.debug("  ✓ %s: %d articles", ticker, len(articles))
+
+    return stock_data, articles, validate_stock_data(stock_data, articles, now=now)
+
+
+async def _search_articles(ticker: str) -> List[Dict[str, Any]]:
+    try:
+        async with _fetch_semaphore:
+            return await search_stock_articles_async(ticker, days_back=7, max_results=5)
+    except Exception as e:
+        logger.warning("  ✗ %s: article search failed: %s", ticker, e)
+        return []
+
 
 def _generate_followup_buttons(ticker: str, query_type: str) -> List[Dict[str, str]]:
     """Generate clickable follow-up question buttons based on the analysis."""
-    t = ticker.upper()
-    
-    followups = [
-        {
-            "text": f"Compare {t} to competitors",
-            "query": f"Compare {t} to its main competitors"
-        }
-    ]
-    
-    if query_type == "current_performance":
-        followups.insert(0, {
-            "text": f"What moved {t} today?",
-            "query": f"What news or events moved {t} today?"
-        })
-    
-    if query_type in ["outlook", "buy_recommendation"]:
-        followups.insert(0, {
-            "text": f"Analyze {t} risks",
-            "query": f"What are the main risks and failure modes for {t}?"
-        })
-    
-    # Add sector-specific suggestions
-    if t == "TSLA":
-        followups.append({
-            "text": "Compare EV valuations",
-            "query": "Compare TSLA, RIVN, and LCID valuations"
-        })
+    # Cached per (ticker, query_type); copy so callers can't mutate the cache
+    return [dict(f) for f in _cached_followup_buttons(ticker.upper(), query_type)]
+
+
+# (text, query) follow-up templates, formatted with the ticker as {t}
+_FOLLOWUP_COMPARE = ("Compare {t} to competitors", "Compare {t} to its main competitors")
+_FOLLOWUP_RISKS = ("Analyze {t} risks", "What are the main risks and failure modes for {t}?")
+_FOLLOWUP_TEMPLATES: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "current_performance": (("What moved {t} today?", "What news or events moved {t} today?"), _FOLLOWUP_COMPARE),
+    "outlook": (_FOLLOWUP_RISKS, _FOLLOWUP_COMPARE),
+    "buy_recommendation": (_FOLLOWUP_RISKS, _FOLLOWUP_COMPARE),
+}
+_DEFAULT_FOLLOWUP_TEMPLATES = (_FOLLOWUP_COMPARE,)
+
+# Sector-specific suggestions appended after the query-type ones
+_TICKER_FOLLOWUP_TEMPLATES: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "TSLA": (("Compare EV valuations", "Compare TSLA, RIVN, and LCID valuations"),),
+}
+
+
+@lru_cache(maxsize=512)
+def _cached_followup_buttons(t: str, query_type: str) -> Tuple[Dict[str, str], ...]:
+    templates = _FOLLOWUP_TEMPLATES.get(query_type, _DEFAULT_FOLLOWUP_TEMPLATES) + _TICKER_FOLLOWUP_TEMPLATES.get(t, ())
     
     # Keep it to 3 follow-ups max
-    return followups[:3]
+    return tuple({"text": text.format(t=t), "query": query.format(t=t)} for text, query in templates[:3])
 
 
 def _generate_comparison_followup_buttons(tickers: List[str]) -> List[Dict[str, str]]:
@@ -335,176 +739,99 @@ async def handle_general_question(question: str, session_id: str) -> AnalysisRes
     """
     Handle general questions with proactive recommendations based on risk tolerance.
     """
-    from anthropic import Anthropic
-    import os
-
-    print("\n[GENERAL QUESTION HANDLER]")
-
-    q_lower = question.lower()
-    has_risk_info = any(word in q_lower for word in ['risk', 'tolerance', 'aggressive', 'conservative', 'play with', 'gamble'])
-    has_timeframe = any(word in q_lower for word in ['year', 'month', 'long term', 'short term', 'hold'])
-
-    system_prompt = """You are a private, internal-use investment reasoning system.
-
-This system operates with access to structured local state, cached market data,
-and precomputed context produced outside the language model.
-
-Your job is to make real investment judgments for a trusted human user.
-Be precise, grounded, and explicit about assumptions and limits.
-
-Core operating philosophy (AUFG-style):
-- evidence before narrative
-- constraints before conclusions
-- uncertainty must be stated explicitly
-- judgments are allowed and expected
-- no fake certainty: risk is time-varying
-
-The user asked a general investing question without specifying a ticker.
+    logger.debug("[GENERAL QUESTION HANDLER]")
 
-Your task:
-Proactively propose a small candidate set and make real judgments.
-Do NOT ask clarifying questions first.
+    system = _general_system_for(question)
+    cache_key = _general_answer_key(question)
 
-––––––––––––––––––––
-Universe & selection rules (STRICT)
-––––––––––––––––––––
-
-1) Default universe (preferred for demos):
-TSLA, NVDA, AMD, PLTR, COIN, AAPL, MSFT, GOOGL, JPM, JNJ, PG
-
-2) You may deviate from the default universe ONLY if:
-- the user's question implies a specific sector/theme (e.g., "energy", "defense", "dividends")
-- OR the default universe is structurally mismatched to the request
-
-If you deviate:
-- include at most 2 extra tickers
-- and explain the reason in one sentence under "Constraints & rationale".
-
-3) Risk labels are NOT permanent.
-You must classify each ticker into a risk regime based on "right now" conditions:
-- volatility / beta intuition
-- business cyclicality
-- valuation fragility
-- current news/earnings sensitivity (if known)
-If unknown, say unknown.
-
-––––––––––––––––––––
-Output format (STRICT)
-––––––––––––––––––––
-
-1) One short acknowledgment of the user's intent.
-
-2) Section title:
-Candidate set (ranked, judgment-based)
-
-First list the candidates in ranked order (best to worst fit for a generic retail investor),
-then bucket them into three time-varying regimes:
-
-- Higher uncertainty / higher variance outcomes
-- Mid uncertainty / quality compounders or platform leverage
-- Lower uncertainty / cash-flow anchored or defensive characteristics
-
-Important:
-Do NOT imply "low risk forever" — these are current regime labels only.
-
-3) For EACH candidate, include exactly four short bullets:
-
-- Approx price range (rough is acceptable)
-- Why it's attractive right now (your judgment)
-- What must go right (explicit condition)
-- Primary failure mode (how this breaks)
-
-4) Section:
-Key considerations for different investor profiles
+    try:
+        answer = _general_answer_cache.get(cache_key)
+        if answer is not None:
+            logger.info("✓ General answer cache hit")
+        else:
+            client = _get_anthropic()
+            message = await client.messages.create(
+                model="claude-sonnet-4-20250514",
+                max_tokens=1200,
+                system=system,
+                messages=[{"role": "user", "content": f"User question: {question}"}]
+            )
 
-In 2–4 sentences:
-Outline which 1–2 names may align with different risk profiles and why,
-given typical constraints (capital size, risk tolerance, time horizon).
+            answer = message.content[0].text
+            _general_answer_cache.set(cache_key, answer)
 
-Frame as "investors seeking X might consider Y because..." rather than personal recommendations.
-Focus on trade-offs and scenarios, not prescriptive advice.
+        return _general_answer_response(answer)
+    except Exception as e:
+        logger.warning("⚠ Network error or API issue: %s", e)
+        return _general_error_response()
 
-5) Section:
-Constraints & unknowns
 
-List 2–3 concrete uncertainties that would materially change your judgments
-(e.g., data freshness, earnings timing, macro sensitivity, missing fundamentals, API limits).
+def _general_system_for(question: str) -> List[Dict[str, Any]]:
+    """System blocks for a general question - with the criteria NOTE if it mentions any."""
+    # Words plus adjacent-word pairs, so "play with" / "long term" match too
+    words = _WORD_RE.findall(question.lower())
+    terms = set(words)
+    terms.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    has_risk_info = not _RISK_TERMS.isdisjoint(terms)
+    has_timeframe = not _TIMEFRAME_TERMS.isdisjoint(terms)
 
-If you added tickers outside the default universe, note that here.
+    return _GENERAL_SYSTEM_WITH_NOTE if (has_risk_info or has_timeframe) else _GENERAL_SYSTEM
 
-––––––––––––––––––––
-Tone constraints
-- calm, analytical, direct
-- no emojis
-- no hype or influencer language
-- no public-facing disclaimers
-"""
-
-    if has_risk_info or has_timeframe:
-        system_prompt += "\n\nNOTE: User mentioned investment criteria. Tailor suggestions accordingly."
 
-    client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+def _general_answer_response(answer: str) -> AnalysisResponse:
+    # Generate follow-ups for general questions
+    suggested_followups = [
+        {
+            "text": "Analyze TSLA",
+            "query": "How is Tesla doing today?"
+        },
+        {
+            "text": "Analyze NVDA", 
+            "query": "Should I buy NVDA?"
+        },
+        {
+            "text": "Compare tech giants",
+            "query": "Compare AAPL, MSFT, and GOOGL"
+        }
+    ]
 
-    try:
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1200,
-            system=system_prompt,
-            messages=[{"role": "user", "content": f"User question: {question}"}]
-        )
+    return AnalysisResponse(
+        success=True,
+        answer=answer,
+        confidence="MEDIUM",
+        confidence_score=60,
+        badge={"emoji": "🟡", "color": "yellow", "message": "Medium confidence - general recommendations"},
+        sources=[],
+        ticker=None,
+        suggested_followups=suggested_followups
+    )
 
-        answer = message.content[0].text
-        
-        # Generate follow-ups for general questions
-        suggested_followups = [
-            {
-                "text": "Analyze TSLA",
-                "query": "How is Tesla doing today?"
-            },
-            {
-                "text": "Analyze NVDA", 
-                "query": "Should I buy NVDA?"
-            },
-            {
-                "text": "Compare tech giants",
-                "query": "Compare AAPL, MSFT, and GOOGL"
-            }
-        ]
 
-        return AnalysisResponse(
-            success=True,
-            answer=answer,
-            confidence="MEDIUM",
-            confidence_score=60,
-            badge={"emoji": "🟡", "color": "yellow", "message": "Medium confidence - general recommendations"},
-            sources=[],
-            ticker=None,
-            suggested_followups=suggested_followups
-        )
-    except Exception as e:
-        print(f"⚠ Network error or API issue: {e}")
-        return AnalysisResponse(
-            success=True,
-            answer=(
-                "I'm having trouble connecting to generate a detailed response right now. "
-                "Try again in a moment, or ask about a specific ticker."
-            ),
-            confidence="LOW",
-            confidence_score=40,
-            badge={"emoji": "🔴", "color": "red", "message": "Low confidence - connection issue"},
-            sources=[],
-            ticker=None
-        )
+def _general_error_response() -> AnalysisResponse:
+    return AnalysisResponse(
+        success=True,
+        answer=(
+            "I'm having trouble connecting to generate a detailed response right now. "
+            "Try again in a moment, or ask about a specific ticker."
+        ),
+        confidence="LOW",
+        confidence_score=40,
+        badge={"emoji": "🔴", "color": "red", "message": "Low confidence - connection issue"},
+        sources=[],
+        ticker=None
+    )
 
 
 @app.get("/api/health")
 async def health_check():
     """Detailed health check with component status"""
+    ready = _db_is_ready()
     return {
         "status": "healthy",
+        "ready": ready,
         "components": {
             "api": "online",
-            "database": "connected",
+            "database": "connected" if ready else "initializing",
             "claude_api": "configured",
             "alpha_vantage": "configured",
             "brave_search": "configured"
@@ -2,13 +2,21 @@
 # Alpha Vantage Premium Tier ($50/month) - 15-minute delayed intraday data
 
 import requests
+import asyncio
+import csv
+import heapq
+import io
+import itertools
+import httpx
 import os
+import random
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Awaitable, Callable, Dict, List, Optional
 from dotenv import load_dotenv
 import sys
 from pathlib import Path
 import time
+from types import MappingProxyType
 
 # Load environment variables
 load_dotenv()
@@ -16,11 +24,113 @@ load_dotenv()
 # Import database functions
 sys.path.append(str(Path(__file__).parent))
 from database import get_cached_data, cache_data
+from http_client import get_async_client, get_session
+from rate_limiter import AsyncRateLimiter
+from ttl_cache import TTLCache
+import json_utils
+from log_setup import get_logger, setup_logging
+
+logger = get_logger("market_data")
 
 # Alpha Vantage API Key
 ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
 ALPHA_VANTAGE_BASE_URL = "https://www.alphavantage.co/query"
 
+# Premium plan quota, shared by every async Alpha Vantage request
+ALPHA_VANTAGE_CALLS_PER_MINUTE = int(os.getenv("ALPHA_VANTAGE_CALLS_PER_MINUTE", "75"))
+_av_limiter = AsyncRateLimiter(ALPHA_VANTAGE_CALLS_PER_MINUTE, 60.0)
+
+# Retries for transient failures: 1s, 2s, ... (+-20% jitter) between tries,
+# or the server's Retry-After when it sends one
+AV_MAX_TRIES = 3
+AV_RETRY_BASE_SECONDS = 1.0
+AV_RETRY_JITTER = 0.2
+AV_MAX_RETRY_AFTER_SECONDS = 30
+_AV_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Cap on tickers fetched at once by get_many_stock_data_async
+MAX_CONCURRENT_TICKERS = 8
+
+# Per-worker tier in front of the SQLite cache, keyed by (ticker, data type),
+# so repeat lookups for hot tickers skip the database entirely
+REALTIME_TTL_SECONDS = 120
+HISTORICAL_TTL_SECONDS = 86400
+COMPANY_INFO_TTL_SECONDS = 30 * 86400
+_memory_cache = TTLCache(maxsize=512, ttl=REALTIME_TTL_SECONDS)
+
+# Lookups Alpha Vantage rejected (typos like "TSLAA"), keyed by
+# (ticker, data type) and remembered briefly so repeat asks don't spend quota
+# on the same error
+NEGATIVE_TTL_SECONDS = 300
+_negative_cache = TTLCache(maxsize=512, ttl=NEGATIVE_TTL_SECONDS)
+
+# Column order of the datatype=csv TIME_SERIES_* responses
+AV_CSV_HEADER = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+
+# Fetches currently running, keyed by (ticker, data type); concurrent callers
+# for the same key await the one request instead of spending quota again
+_inflight: Dict[tuple, asyncio.Future] = {}
+
+
+async def _av_get(params: Dict) -> httpx.Response:
+    """
+    GET an Alpha Vantage query on the shared client, within the rate limit.
+    Timeouts, connection errors, 429/5xx and rate-limit 'Note' replies are
+    retried with exponential backoff; the last attempt is returned / raised.
+    """
+    for attempt in range(AV_MAX_TRIES):
+        last_try = attempt == AV_MAX_TRIES - 1
+        retry_after = None
+        try:
+            async with _av_limiter:
+                response = await get_async_client().get(ALPHA_VANTAGE_BASE_URL, params=params)
+        except (httpx.TimeoutException, httpx.NetworkError) as e:
+            if last_try:
+                raise
+            reason = type(e).__name__
+        else:
+            if last_try or not _should_retry(response):
+                return response
+            reason = f"HTTP {response.status_code}" if response.status_code != 200 else "rate limit note"
+            retry_after = _retry_after_seconds(response)
+        
+        if retry_after is None:
+            jitter = random.uniform(1 - AV_RETRY_JITTER, 1 + AV_RETRY_JITTER)
+            retry_after = AV_RETRY_BASE_SECONDS * (2 ** attempt) * jitter
+        logger.warning("⚠ Alpha Vantage %s %s: %s, retrying in %.1fs", params.get('function'), params.get('symbol'), reason, retry_after)
+        await asyncio.sleep(retry_after)
+
+
+def _should_retry(response: httpx.Response) -> bool:
+    if response.status_code in _AV_RETRY_STATUSES:
+        return True
+    # Per-minute limit hits come back as 200 with a JSON 'Note'
+    content = response.content
+    return response.status_code == 200 and content.lstrip()[:1] == b'{' and b'"Note"' in content
+
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Retry-After in seconds (capped), or None if absent / not a number."""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return min(max(float(value), 0.0), AV_MAX_RETRY_AFTER_SECONDS)
+    except ValueError:
+        return None
+
+
+async def _coalesced(key: tuple, fetch: Callable[[], Awaitable]):
+    """Run fetch() once for all concurrent callers asking for the same key."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: one caller being cancelled must not cancel the shared fetch
+    return await asyncio.shield(task)
+
 
 def get_current_price(ticker: str) -> Optional[Dict]:
     """
@@ -37,126 +147,344 @@ def get_current_price(ticker: str) -> Optional[Dict]:
     
     ticker = ticker.upper()
     
-    # Check cache first (2 minute cache)
-    cached = get_cached_data(ticker, 'realtime')
+    cached = _cached_current_price(ticker)
     if cached:
-        cache_age = (datetime.now() - datetime.fromisoformat(cached['timestamp'])).total_seconds()
-        if cache_age < 120:  # 2 minutes
-            data_age_str = cached.get('data_age_display', 'unknown age')
-            print(f"✓ Cache hit: {ticker} realtime data (cache: {int(cache_age)}s old, market data: {data_age_str})")
-            return cached
+        return cached
+    
+    if _known_bad(ticker, 'realtime'):
+        return None
     
-    print(f"⏳ Fetching {ticker} current price from Alpha Vantage (Premium 1min intraday)...")
+    logger.debug("⏳ Fetching %s current price from Alpha Vantage (Premium 1min intraday)...", ticker)
     
     try:
-        # Use TIME_SERIES_INTRADAY with 1min interval for freshest premium data
-        params = {
-            'function': 'TIME_SERIES_INTRADAY',
-            'symbol': ticker,
-            'interval': '1min',
-            'outputsize': 'compact',  # Latest 100 data points
-            'entitlement': 'delayed',  # CRITICAL: Required for 15-min    delayed premium data
-            'apikey': ALPHA_VANTAGE_API_KEY
-         }
-        
-        response = requests.get(ALPHA_VANTAGE_BASE_URL, params=params, timeout=10)
+        response = get_session().get(ALPHA_VANTAGE_BASE_URL, params=_intraday_params(ticker), timeout=10)
         response.raise_for_status()
         
-        data_json = response.json()
-        
-        # Check for rate limit or error
-        if 'Note' in data_json:
-            print(f"⚠ Rate limit hit: {data_json['Note']}")
-            return None
-        
-        if 'Error Message' in data_json:
-            print(f"✗ API Error: {data_json['Error Message']}")
-            return None
-        
-        if 'Information' in data_json:
-            print(f"⚠ API Info: {data_json['Information']}")
-            return None
-        
-        if 'Time Series (1min)' not in data_json:
-            print(f"✗ No intraday data returned for {ticker}")
-            print(f"Response keys: {list(data_json.keys())}")
-            return None
-        
-        time_series = data_json['Time Series (1min)']
+        return _parse_current_price(ticker, response.content)
         
-        if not time_series:
-            print(f"✗ Empty time series for {ticker}")
-            return None
+    except requests.exceptions.RequestException as e:
+        logger.warning("✗ Network error fetching %s: %s", ticker, e)
+        return None
+    except Exception as e:
+        logger.exception("✗ Failed to fetch %s: %s", ticker, e)
+        return None
+
+
+async def get_current_price_async(ticker: str) -> Optional[Dict]:
+    """Async variant of get_current_price (same cache, non-blocking HTTP)."""
+    
+    ticker = ticker.upper()
+    
+    cached = _cached_current_price(ticker)
+    if cached:
+        return cached
+    
+    if _known_bad(ticker, 'realtime'):
+        return None
+    
+    return await _coalesced((ticker, 'realtime'), lambda: _fetch_current_price_async(ticker))
+
+
+async def _fetch_current_price_async(ticker: str) -> Optional[Dict]:
+    logger.debug("⏳ Fetching %s current price from Alpha Vantage (Premium 1min intraday)...", ticker)
+    
+    try:
+        response = await _av_get(_intraday_params(ticker))
+        response.raise_for_status()
         
-        # Get the most recent data point (first key when sorted)
-        latest_timestamp = sorted(time_series.keys(), reverse=True)[0]
-        latest_data = time_series[latest_timestamp]
+        return _parse_current_price(ticker, response.content)
         
-        # Calculate how old the data is
-        try:
-            data_time = datetime.fromisoformat(latest_timestamp.replace(' ', 'T'))
-            data_age_seconds = (datetime.now() - data_time).total_seconds()
-            data_age_minutes = int(data_age_seconds / 60)
-            
-            if data_age_minutes < 60:
-                data_age_display = f"{data_age_minutes}min old"
-            else:
-                data_age_hours = int(data_age_minutes / 60)
-                data_age_display = f"{data_age_hours}h {data_age_minutes % 60}min old"
-        except:
-            data_age_display = "unknown age"
-            data_age_minutes = 999
+    except httpx.HTTPError as e:
+        logger.warning("✗ Network error fetching %s: %s", ticker, e)
+        return None
+    except Exception as e:
+        logger.exception("✗ Failed to fetch %s: %s", ticker, e)
+        return None
+
+
+def _cached_current_price(ticker: str, data_type: str = 'realtime') -> Optional[Dict]:
+    """Return the cached realtime quote if it is under 2 minutes old.
+    data_type 'realtime_bulk' reads the bulk-quote slot instead."""
+    
+    cached = _memory_cache.get((ticker, data_type))
+    from_db = cached is None
+    if from_db:
+        # Check cache first (2 minute cache)
+        cached = get_cached_data(ticker, data_type)
+    if cached:
+        # Rows from before cached_at existed count as stale and get refetched
+        cache_age = time.time() - cached.get('cached_at', 0)
+        if cache_age < REALTIME_TTL_SECONDS:  # 2 minutes
+            if from_db:
+                _memory_cache.set((ticker, data_type), cached, ttl=REALTIME_TTL_SECONDS - cache_age)
+            # Prices are served as stored; only the market-data age moves on.
+            # The cached dict is shared (memory tier, earlier responses), so
+            # the refreshed age goes on a copy
+            if cached.get('data_epoch') is not None:
+                data_age_minutes, data_age_display = _data_age(cached['data_epoch'])
+                cached = {**cached, 'data_age_minutes': data_age_minutes, 'data_age_display': data_age_display}
+            data_age_str = cached.get('data_age_display', 'unknown age')
+            logger.debug("✓ Cache hit: %s %s data (cache: %ds old, market data: %s)", ticker, data_type, cache_age, data_age_str)
+            return cached
+    return None
+
+
+def _known_bad(ticker: str, data_type: str) -> bool:
+    reason = _negative_cache.get((ticker, data_type))
+    if reason is not None:
+        logger.debug("✓ Negative cache hit: %s %s (%s)", ticker, data_type, reason)
+        return True
+    return False
+
+
+def _remember_bad(ticker: str, data_type: str, reason: str) -> None:
+    """Skip further lookups of this kind for NEGATIVE_TTL_SECONDS."""
+    _negative_cache.set((ticker, data_type), reason)
+
+
+def _store(ticker: str, data_type: str, data: Dict, ttl: float) -> None:
+    """Write a fetched result to SQLite and the in-process tier."""
+    cache_data(ticker, data_type, data)
+    _memory_cache.set((ticker, data_type), data, ttl=ttl)
+
+
+# Use TIME_SERIES_INTRADAY with 1min interval for freshest premium data.
+# Only 'symbol' varies per call, so the rest is built once.
+_INTRADAY_BASE = MappingProxyType({
+    'function': 'TIME_SERIES_INTRADAY',
+    'interval': '1min',
+    'outputsize': 'compact',  # Latest 100 data points
+    'entitlement': 'delayed',  # CRITICAL: Required for 15-min    delayed premium data
+    'datatype': 'csv',  # Flat rows, much smaller than the JSON time series
+    'apikey': ALPHA_VANTAGE_API_KEY
+})
+
+
+def _intraday_params(ticker: str) -> Dict:
+    return {**_INTRADAY_BASE, 'symbol': ticker}
+
+
+def _read_av_csv(ticker: str, data_type: str, content: bytes, max_rows: Optional[int] = None) -> Optional[List[List[str]]]:
+    """
+    Data rows of a datatype=csv TIME_SERIES_* response
+    (timestamp, open, high, low, close, volume), or None on an error reply.
+    Alpha Vantage still answers rate limits and errors with a JSON body.
+    
+    Rows arrive newest first; with max_rows only that many are decoded and
+    split, the rest of the body is never touched.
+    """
+    
+    if content.lstrip()[:1] == b'{':
+        data_json = json_utils.loads(content)
         
-        # Get previous close for change calculation
-        timestamps = sorted(time_series.keys(), reverse=True)
-        if len(timestamps) > 1:
-            previous_data = time_series[timestamps[1]]
-            previous_close = float(previous_data['4. close'])
+        # Check for rate limit or error
+        if 'Note' in data_json:
+            logger.warning("⚠ Rate limit hit: %s", data_json['Note'])
+        elif 'Error Message' in data_json:
+            logger.warning("✗ API Error: %s", data_json['Error Message'])
+            # Invalid symbol (or call) - not something a retry fixes
+            _remember_bad(ticker, data_type, data_json['Error Message'])
+        elif 'Information' in data_json:
+            logger.warning("⚠ API Info: %s", data_json['Information'])
         else:
-            previous_close = float(latest_data['1. open'])
-        
-        current_price = float(latest_data['4. close'])
-        change = current_price - previous_close
-        change_percent = (change / previous_close * 100) if previous_close else 0
-        
-        data = {
-            "ticker": ticker,
-            "current_price": round(current_price, 2),
-            "previous_close": round(previous_close, 2),
-            "open": round(float(latest_data['1. open']), 2),
-            "day_high": round(float(latest_data['2. high']), 2),
-            "day_low": round(float(latest_data['3. low']), 2),
-            "volume": int(latest_data['5. volume']),
-            "company_name": ticker,
-            "change": round(change, 2),
-            "change_percent": round(change_percent, 2),
-            "timestamp": datetime.now().isoformat(),
-            "data_timestamp": latest_timestamp,
-            "data_age_minutes": data_age_minutes,
-            "data_age_display": data_age_display
-        }
-        
-        # Cache for 2 minutes
-        cache_data(ticker, 'realtime', data)
-        
-        print(f"✓ Fetched and cached: {ticker} @ ${data['current_price']} (market data is {data_age_display})")
-        
-        # Warning if data is older than expected
-        if data_age_minutes > 30:
-            print(f"⚠ WARNING: Market data is {data_age_display} - may be stale (market closed or API delay)")
-        
-        return data
-        
-    except requests.exceptions.RequestException as e:
-        print(f"✗ Network error fetching {ticker}: {e}")
+            logger.warning("✗ No time series data returned for %s (response keys: %s)", ticker, list(data_json.keys()))
         return None
-    except Exception as e:
-        print(f"✗ Failed to fetch {ticker}: {e}")
-        import traceback
-        traceback.print_exc()
+    
+    # TextIOWrapper decodes lazily, line by line, as the reader pulls rows
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(content), encoding='utf-8', newline=''))
+    header = next(reader, None)
+    if header != AV_CSV_HEADER:
+        logger.warning("✗ Unexpected CSV header for %s: %s", ticker, header)
+        return None
+    
+    return list(itertools.islice(filter(None, reader), max_rows))
+
+
+def _parse_current_price(ticker: str, content: bytes) -> Optional[Dict]:
+    """Turn a TIME_SERIES_INTRADAY csv response into the realtime quote dict and cache it."""
+    
+    # Only the latest bar and the one before it are used
+    rows = _read_av_csv(ticker, 'realtime', content, max_rows=2)
+    if rows is None:
+        return None
+    
+    if not rows:
+        logger.warning("✗ Empty time series for %s", ticker)
+        return None
+    
+    # Latest first - ISO timestamps (first column) sort lexicographically
+    top2 = heapq.nlargest(2, rows)
+    latest_data = top2[0]
+    latest_timestamp = latest_data[0]
+    
+    # Calculate how old the data is
+    data_epoch = _market_epoch(latest_timestamp)
+    data_age_minutes, data_age_display = _data_age(data_epoch)
+    
+    # Get previous close for change calculation
+    if len(top2) > 1:
+        previous_close = float(top2[1][4])
+    else:
+        previous_close = float(latest_data[1])
+    
+    current_price = float(latest_data[4])
+    change = current_price - previous_close
+    change_percent = (change / previous_close * 100) if previous_close else 0
+    
+    data = {
+        "ticker": ticker,
+        "current_price": round(current_price, 2),
+        "previous_close": round(previous_close, 2),
+        "open": round(float(latest_data[1]), 2),
+        "day_high": round(float(latest_data[2]), 2),
+        "day_low": round(float(latest_data[3]), 2),
+        "volume": int(latest_data[5]),
+        "company_name": ticker,
+        "change": round(change, 2),
+        "change_percent": round(change_percent, 2),
+        "timestamp": datetime.now().isoformat(),
+        "cached_at": int(time.time()),
+        "data_timestamp": latest_timestamp,
+        "data_epoch": data_epoch,
+        "data_age_minutes": data_age_minutes,
+        "data_age_display": data_age_display
+    }
+    
+    # Cache for 2 minutes
+    _store(ticker, 'realtime', data, REALTIME_TTL_SECONDS)
+    
+    logger.info("✓ Fetched and cached: %s @ $%s (market data is %s)", ticker, data['current_price'], data_age_display)
+    
+    # Warning if data is older than expected
+    if data_age_minutes > 30:
+        logger.warning("⚠ Market data is %s - may be stale (market closed or API delay)", data_age_display)
+    
+    return data
+
+
+def _market_epoch(market_timestamp: str) -> Optional[int]:
+    """Unix seconds for an Alpha Vantage market timestamp, parsed once per fetch."""
+    try:
+        return int(datetime.fromisoformat(market_timestamp.replace(' ', 'T')).timestamp())
+    except ValueError:
         return None
 
 
+def _data_age(data_epoch: Optional[int]):
+    """(age in minutes, display string) for a market data epoch."""
+    if data_epoch is None:
+        return 999, "unknown age"
+    
+    data_age_minutes = int((time.time() - data_epoch) / 60)
+    
+    if data_age_minutes < 60:
+        data_age_display = f"{data_age_minutes}min old"
+    else:
+        data_age_hours = int(data_age_minutes / 60)
+        data_age_display = f"{data_age_hours}h {data_age_minutes % 60}min old"
+    return data_age_minutes, data_age_display
+
+
+_BULK_QUOTES_BASE = MappingProxyType({
+    'function': 'REALTIME_BULK_QUOTES',
+    'entitlement': 'delayed',
+    'apikey': ALPHA_VANTAGE_API_KEY
+})
+
+
+async def get_current_prices_batch_async(tickers: List[str]) -> Dict[str, Dict]:
+    """
+    Realtime quotes for several tickers from one REALTIME_BULK_QUOTES call,
+    for comparisons.
+    
+    Bulk quotes measure change against the daily previous_close, while
+    get_current_price* measures it against the previous 1-minute bar, so they
+    are cached under their own 'realtime_bulk' slot and never served as a
+    single-ticker quote. Tickers already fresh in that slot are not refetched.
+    Anything missing from the bulk response is left out; the caller falls
+    back to the per-ticker intraday fetch.
+    
+    Returns:
+        Dictionary of ticker -> quote dict (cached or fetched in this call)
+    """
+    
+    quotes = {}
+    missing = []
+    for t in dict.fromkeys(t.upper() for t in tickers):
+        cached = _cached_current_price(t, 'realtime_bulk')
+        if cached:
+            quotes[t] = cached
+        else:
+            missing.append(t)
+    if not missing:
+        return quotes
+    
+    logger.debug("⏳ Fetching bulk quotes for %s from Alpha Vantage...", ', '.join(missing))
+    
+    # Up to 100 symbols per call
+    params = {**_BULK_QUOTES_BASE, 'symbol': ','.join(missing[:100])}
+    
+    try:
+        response = await _av_get(params)
+        response.raise_for_status()
+        data_json = json_utils.loads(response.content)
+    except Exception as e:
+        logger.warning("⚠ Bulk quote fetch failed, falling back to per-ticker: %s", e)
+        return quotes
+    
+    if not isinstance(data_json.get('data'), list):
+        logger.warning("⚠ No bulk quote data returned, falling back to per-ticker")
+        return quotes
+    
+    fetched = 0
+    for row in data_json['data']:
+        ticker = str(row.get('symbol', '')).upper()
+        if ticker not in missing:
+            continue
+        try:
+            data = _bulk_quote_to_realtime(ticker, row)
+        except (KeyError, TypeError, ValueError):
+            continue
+        _store(ticker, 'realtime_bulk', data, REALTIME_TTL_SECONDS)
+        quotes[ticker] = data
+        fetched += 1
+    
+    logger.info("✓ Bulk quotes cached for %d/%d tickers", fetched, len(missing))
+    return quotes
+
+
+def _bulk_quote_to_realtime(ticker: str, row: Dict) -> Dict:
+    """Map one REALTIME_BULK_QUOTES row onto the get_current_price dict shape."""
+    
+    current_price = float(row['close'])
+    previous_close = float(row.get('previous_close') or row['open'])
+    change = current_price - previous_close
+    change_percent = (change / previous_close * 100) if previous_close else 0
+    
+    latest_timestamp = str(row.get('timestamp', ''))
+    data_epoch = _market_epoch(latest_timestamp)
+    data_age_minutes, data_age_display = _data_age(data_epoch)
+    
+    return {
+        "ticker": ticker,
+        "current_price": round(current_price, 2),
+        "previous_close": round(previous_close, 2),
+        "open": round(float(row['open']), 2),
+        "day_high": round(float(row['high']), 2),
+        "day_low": round(float(row['low']), 2),
+        "volume": int(float(row['volume'])),
+        "company_name": ticker,
+        "change": round(change, 2),
+        "change_percent": round(change_percent, 2),
+        "timestamp": datetime.now().isoformat(),
+        "cached_at": int(time.time()),
+        "data_timestamp": latest_timestamp,
+        "data_epoch": data_epoch,
+        "data_age_minutes": data_age_minutes,
+        "data_age_display": data_age_display
+    }
+
+
 def get_historical_data(ticker: str, period: str = "1y") -> Optional[Dict]:
     """
     Get historical stock data from Alpha Vantage.
@@ -166,88 +494,146 @@ def get_historical_data(ticker: str, period: str = "1y") -> Optional[Dict]:
     ticker = ticker.upper()
     cache_key = f"historical_{period}"
     
-    # Check cache (24 hour cache)
-    cached = get_cached_data(ticker, cache_key)
+    cached = _cached_historical(ticker, period, cache_key)
     if cached:
-        cache_age = (datetime.now() - datetime.fromisoformat(cached['timestamp'])).total_seconds()
-        if cache_age < 86400:  # 24 hours
-            print(f"✓ Cache hit: {ticker} {period} historical data")
-            return cached
+        return cached
     
-    print(f"⏳ Fetching {ticker} historical data from Alpha Vantage...")
+    if _known_bad(ticker, cache_key):
+        return None
+    
+    logger.debug("⏳ Fetching %s historical data from Alpha Vantage...", ticker)
     
     try:
-        params = {
-            'function': 'TIME_SERIES_DAILY',
-            'symbol': ticker,
-            'outputsize': 'compact',
-            'apikey': ALPHA_VANTAGE_API_KEY
-        }
-        
-        response = requests.get(ALPHA_VANTAGE_BASE_URL, params=params, timeout=10)
+        response = get_session().get(ALPHA_VANTAGE_BASE_URL, params=_daily_params(ticker), timeout=10)
         response.raise_for_status()
         
-        data_json = response.json()
-        
-        if 'Note' in data_json:
-            print(f"⚠ Rate limit hit")
-            return None
-        
-        if 'Error Message' in data_json:
-            print(f"✗ API Error: {data_json['Error Message']}")
-            return None
-        
-        if 'Time Series (Daily)' not in data_json:
-            print(f"✗ No historical data for {ticker}")
-            return None
-        
-        time_series = data_json['Time Series (Daily)']
-        dates = sorted(time_series.keys(), reverse=True)
+        return _parse_historical(ticker, period, cache_key, response.content)
         
-        if len(dates) < 2:
-            print(f"✗ Insufficient historical data")
-            return None
-        
-        # Filter by period
-        period_days = {'1mo': 30, '3mo': 90, '6mo': 180, '1y': 365}
-        days = period_days.get(period, 365)
-        filtered_dates = dates[:min(days, len(dates))]
-        
-        # Calculate statistics
-        oldest = time_series[filtered_dates[-1]]
-        newest = time_series[filtered_dates[0]]
-        
-        opening_price = float(oldest['1. open'])
-        closing_price = float(newest['4. close'])
-        
-        all_highs = [float(time_series[d]['2. high']) for d in filtered_dates]
-        all_lows = [float(time_series[d]['3. low']) for d in filtered_dates]
-        all_volumes = [int(time_series[d]['5. volume']) for d in filtered_dates]
-        
-        data = {
-            "ticker": ticker,
-            "period": period,
-            "period_label": f"Past {days} days",
-            "start_date": filtered_dates[-1],
-            "end_date": filtered_dates[0],
-            "data_points": len(filtered_dates),
-            "opening_price": opening_price,
-            "closing_price": closing_price,
-            "high": max(all_highs),
-            "low": min(all_lows),
-            "avg_volume": int(sum(all_volumes) / len(all_volumes)),
-            "total_return": round(((closing_price / opening_price) - 1) * 100, 2),
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        cache_data(ticker, cache_key, data)
-        print(f"✓ Fetched and cached: {ticker} historical ({period})")
+    except Exception as e:
+        logger.warning("✗ Failed to fetch historical data for %s: %s", ticker, e)
+        return None
+
+
+async def get_historical_data_async(ticker: str, period: str = "1y") -> Optional[Dict]:
+    """Async variant of get_historical_data."""
+    
+    ticker = ticker.upper()
+    cache_key = f"historical_{period}"
+    
+    cached = _cached_historical(ticker, period, cache_key)
+    if cached:
+        return cached
+    
+    if _known_bad(ticker, cache_key):
+        return None
+    
+    return await _coalesced((ticker, cache_key), lambda: _fetch_historical_async(ticker, period, cache_key))
+
+
+async def _fetch_historical_async(ticker: str, period: str, cache_key: str) -> Optional[Dict]:
+    logger.debug("⏳ Fetching %s historical data from Alpha Vantage...", ticker)
+    
+    try:
+        response = await _av_get(_daily_params(ticker))
+        response.raise_for_status()
         
-        return data
+        return _parse_historical(ticker, period, cache_key, response.content)
         
     except Exception as e:
-        print(f"✗ Failed to fetch historical data for {ticker}: {e}")
+        logger.warning("✗ Failed to fetch historical data for %s: %s", ticker, e)
+        return None
+
+
+def _cached_historical(ticker: str, period: str, cache_key: str) -> Optional[Dict]:
+    cached = _memory_cache.get((ticker, cache_key))
+    from_db = cached is None
+    if from_db:
+        # Check cache (24 hour cache)
+        cached = get_cached_data(ticker, cache_key)
+    if cached:
+        # Rows from before cached_at existed count as stale and get refetched
+        cache_age = time.time() - cached.get('cached_at', 0)
+        if cache_age < HISTORICAL_TTL_SECONDS:  # 24 hours
+            logger.debug("✓ Cache hit: %s %s historical data", ticker, period)
+            if from_db:
+                _memory_cache.set((ticker, cache_key), cached, ttl=HISTORICAL_TTL_SECONDS - cache_age)
+            return cached
+    return None
+
+
+_DAILY_BASE = MappingProxyType({
+    'function': 'TIME_SERIES_DAILY',
+    'outputsize': 'compact',
+    'datatype': 'csv',
+    'apikey': ALPHA_VANTAGE_API_KEY
+})
+
+
+def _daily_params(ticker: str) -> Dict:
+    return {**_DAILY_BASE, 'symbol': ticker}
+
+
+# Trading-day window per period label
+PERIOD_DAYS = {'1mo': 30, '3mo': 90, '6mo': 180, '1y': 365}
+
+
+def _parse_historical(ticker: str, period: str, cache_key: str, content: bytes) -> Optional[Dict]:
+    """Summarize a TIME_SERIES_DAILY csv response for the period and cache it."""
+    
+    rows = _read_av_csv(ticker, cache_key, content)
+    if rows is None:
+        return None
+    
+    if len(rows) < 2:
+        logger.warning("✗ Insufficient historical data for %s", ticker)
         return None
+    
+    # Filter by period - the newest `days` bars, newest first, without
+    # sorting the whole series
+    days = PERIOD_DAYS.get(period, 365)
+    filtered = heapq.nlargest(min(days, len(rows)), rows)
+    
+    # Calculate statistics
+    oldest = filtered[-1]
+    newest = filtered[0]
+    
+    opening_price = float(oldest[1])
+    closing_price = float(newest[4])
+    
+    # High / low / total volume in one pass over the bars
+    high = float('-inf')
+    low = float('inf')
+    total_volume = 0
+    for bar in filtered:
+        bar_high = float(bar[2])
+        bar_low = float(bar[3])
+        if bar_high > high:
+            high = bar_high
+        if bar_low < low:
+            low = bar_low
+        total_volume += int(bar[5])
+    
+    data = {
+        "ticker": ticker,
+        "period": period,
+        "period_label": f"Past {days} days",
+        "start_date": oldest[0],
+        "end_date": newest[0],
+        "data_points": len(filtered),
+        "opening_price": opening_price,
+        "closing_price": closing_price,
+        "high": high,
+        "low": low,
+        "avg_volume": int(total_volume / len(filtered)),
+        "total_return": round(((closing_price / opening_price) - 1) * 100, 2),
+        "timestamp": datetime.now().isoformat(),
+        "cached_at": int(time.time())
+    }
+    
+    _store(ticker, cache_key, data, HISTORICAL_TTL_SECONDS)
+    logger.info("✓ Fetched and cached: %s historical (%s)", ticker, period)
+    
+    return data
 
 
 def get_company_info(ticker: str) -> Optional[Dict]:
@@ -258,65 +644,120 @@ def get_company_info(ticker: str) -> Optional[Dict]:
     
     ticker = ticker.upper()
     
-    # Check cache
-    cached = get_cached_data(ticker, 'company_info')
+    cached = _cached_company_info(ticker)
     if cached:
-        print(f"✓ Cache hit: {ticker} company info")
         return cached
     
-    print(f"⏳ Fetching {ticker} company info from Alpha Vantage...")
+    if _known_bad(ticker, 'company_info'):
+        return None
+    
+    logger.debug("⏳ Fetching %s company info from Alpha Vantage...", ticker)
     
     try:
-        params = {
-            'function': 'OVERVIEW',
-            'symbol': ticker,
-            'apikey': ALPHA_VANTAGE_API_KEY
-        }
-        
-        response = requests.get(ALPHA_VANTAGE_BASE_URL, params=params, timeout=10)
+        response = get_session().get(ALPHA_VANTAGE_BASE_URL, params=_overview_params(ticker), timeout=10)
         response.raise_for_status()
         
-        overview = response.json()
+        return _parse_company_info(ticker, json_utils.loads(response.content))
         
-        if 'Note' in overview:
-            print(f"⚠ Rate limit hit")
-            return None
-        
-        if not overview or 'Symbol' not in overview:
-            print(f"✗ No company info for {ticker}")
-            return None
-        
-        data = {
-            "ticker": ticker,
-            "company_name": overview.get('Name'),
-            "sector": overview.get('Sector'),
-            "industry": overview.get('Industry'),
-            "description": overview.get('Description'),
-            "exchange": overview.get('Exchange'),
-            "market_cap": overview.get('MarketCapitalization'),
-            "pe_ratio": overview.get('PERatio'),
-            "dividend_yield": overview.get('DividendYield'),
-            "52_week_high": overview.get('52WeekHigh'),
-            "52_week_low": overview.get('52WeekLow'),
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        cache_data(ticker, 'company_info', data)
-        print(f"✓ Fetched and cached: {ticker} company info")
+    except Exception as e:
+        logger.warning("✗ Failed to fetch company info for %s: %s", ticker, e)
+        return None
+
+
+async def get_company_info_async(ticker: str) -> Optional[Dict]:
+    """Async variant of get_company_info."""
+    
+    ticker = ticker.upper()
+    
+    cached = _cached_company_info(ticker)
+    if cached:
+        return cached
+    
+    if _known_bad(ticker, 'company_info'):
+        return None
+    
+    return await _coalesced((ticker, 'company_info'), lambda: _fetch_company_info_async(ticker))
+
+
+async def _fetch_company_info_async(ticker: str) -> Optional[Dict]:
+    logger.debug("⏳ Fetching %s company info from Alpha Vantage...", ticker)
+    
+    try:
+        response = await _av_get(_overview_params(ticker))
+        response.raise_for_status()
         
-        return data
+        return _parse_company_info(ticker, json_utils.loads(response.content))
         
     except Exception as e:
-        print(f"✗ Failed to fetch company info for {ticker}: {e}")
+        logger.warning("✗ Failed to fetch company info for %s: %s", ticker, e)
         return None
 
 
-def get_stock_data(ticker: str, include_historical: bool = False) -> Dict:
-    """
-    Get comprehensive stock data (current + company info + optional historical).
-    """
+def _cached_company_info(ticker: str) -> Optional[Dict]:
+    cached = _memory_cache.get((ticker, 'company_info'))
+    from_db = cached is None
+    if from_db:
+        # Check cache
+        cached = get_cached_data(ticker, 'company_info')
+    if cached:
+        # Rows from before cached_at existed count as stale and get refetched
+        cache_age = time.time() - cached.get('cached_at', 0)
+        if cache_age < COMPANY_INFO_TTL_SECONDS:
+            logger.debug("✓ Cache hit: %s company info", ticker)
+            if from_db:
+                _memory_cache.set((ticker, 'company_info'), cached, ttl=COMPANY_INFO_TTL_SECONDS - cache_age)
+            return cached
+    return None
+
+
+_OVERVIEW_BASE = MappingProxyType({
+    'function': 'OVERVIEW',
+    'apikey': ALPHA_VANTAGE_API_KEY
+})
+
+
+def _overview_params(ticker: str) -> Dict:
+    return {**_OVERVIEW_BASE, 'symbol': ticker}
+
+
+def _parse_company_info(ticker: str, overview: Dict) -> Optional[Dict]:
+    """Pick the fields we use out of an OVERVIEW response and cache them."""
     
-    result = {
+    if 'Note' in overview:
+        logger.warning("⚠ Rate limit hit fetching %s company info", ticker)
+        return None
+    
+    if not overview or 'Symbol' not in overview:
+        logger.warning("✗ No company info for %s", ticker)
+        # OVERVIEW answers unknown symbols (and ETFs) with an empty object
+        if not overview:
+            _remember_bad(ticker, 'company_info', "no company overview")
+        return None
+    
+    data = {
+        "ticker": ticker,
+        "company_name": overview.get('Name'),
+        "sector": overview.get('Sector'),
+        "industry": overview.get('Industry'),
+        "description": overview.get('Description'),
+        "exchange": overview.get('Exchange'),
+        "market_cap": overview.get('MarketCapitalization'),
+        "pe_ratio": overview.get('PERatio'),
+        "dividend_yield": overview.get('DividendYield'),
+        "52_week_high": overview.get('52WeekHigh'),
+        "52_week_low": overview.get('52WeekLow'),
+        "timestamp": datetime.now().isoformat(),
+        "cached_at": int(time.time())
+    }
+    
+    _store(ticker, 'company_info', data, COMPANY_INFO_TTL_SECONDS)
+    logger.info("✓ Fetched and cached: %s company info", ticker)
+    
+    return data
+
+
+def _new_stock_result(ticker: str) -> Dict:
+    return {
         "ticker": ticker.upper(),
         "success": False,
         "current": None,
@@ -324,6 +765,15 @@ def get_stock_data(ticker: str, include_historical: bool = False) -> Dict:
         "company": None,
         "errors": []
     }
+
+
+def get_stock_data(ticker: str, include_historical: bool = False) -> Dict:
+    """
+    Get comprehensive stock data (current + company info + optional historical).
+    Blocking version for scripts; the API uses get_stock_data_async.
+    """
+    
+    result = _new_stock_result(ticker)
     
     # Get current price (1-minute intraday, 15-min delayed)
     current = get_current_price(ticker)
@@ -333,8 +783,6 @@ def get_stock_data(ticker: str, include_historical: bool = False) -> Dict:
     else:
         result["errors"].append("Failed to fetch current price")
     
-    time.sleep(0.5)
-    
     # Get company info
     company = get_company_info(ticker)
     if company:
@@ -344,7 +792,6 @@ def get_stock_data(ticker: str, include_historical: bool = False) -> Dict:
     
     # Get historical data if requested
     if include_historical:
-        time.sleep(0.5)
         historical = get_historical_data(ticker, period="1y")
         if historical:
             result["historical"] = historical
@@ -354,8 +801,81 @@ def get_stock_data(ticker: str, include_historical: bool = False) -> Dict:
     return result
 
 
+async def get_stock_data_async(ticker: str, include_historical: bool = False, current: Optional[Dict] = None) -> Dict:
+    """
+    Async variant of get_stock_data for the API. The quote, company info and
+    (optional) history requests are independent, so they run concurrently.
+    A quote passed as `current` (e.g. from get_current_prices_batch_async) is
+    used instead of fetching one.
+    """
+    
+    result = _new_stock_result(ticker)
+    
+    current, company, historical = await asyncio.gather(
+        _given(current) if current else get_current_price_async(ticker),
+        get_company_info_async(ticker),
+        get_historical_data_async(ticker, period="1y") if include_historical else _skipped(),
+    )
+    
+    if current:
+        result["current"] = current
+        result["success"] = True
+    else:
+        result["errors"].append("Failed to fetch current price")
+    
+    if company:
+        result["company"] = company
+    else:
+        result["errors"].append("Failed to fetch company info")
+    
+    if include_historical:
+        if historical:
+            result["historical"] = historical
+        else:
+            result["errors"].append("Failed to fetch historical data")
+    
+    return result
+
+
+async def _skipped() -> None:
+    return None
+
+
+async def _given(value: Dict) -> Dict:
+    return value
+
+
+async def get_many_stock_data_async(tickers: List[str], include_historical: bool = False) -> Dict[str, Dict]:
+    """
+    get_stock_data_async for many tickers at once, at most
+    MAX_CONCURRENT_TICKERS in flight. A ticker that raises gets a failed
+    result instead of failing the whole batch.
+    """
+    
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TICKERS)
+    
+    async def fetch(ticker: str) -> Dict:
+        async with semaphore:
+            return await get_stock_data_async(ticker, include_historical=include_historical, current=quotes.get(ticker))
+    
+    symbols = list(dict.fromkeys(t.upper() for t in tickers))
+    quotes = await get_current_prices_batch_async(symbols)
+    results = await asyncio.gather(*(fetch(t) for t in symbols), return_exceptions=True)
+    
+    batch = {}
+    for ticker, result in zip(symbols, results):
+        if isinstance(result, BaseException):
+            logger.warning("✗ Failed to fetch %s: %s", ticker, result)
+            failed = _new_stock_result(ticker)
+            failed["errors"].append(f"Fetch failed: {result}")
+            result = failed
+        batch[ticker] = result
+    return batch
+
+
 if __name__ == "__main__":
     """Test market data functions"""
+    setup_logging()
     print("\n" + "="*60)
     print("MARKET DATA MODULE - Test (Alpha Vantage Premium)")
     print("="*60)
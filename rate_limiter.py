@@ -0,0 +1,39 @@
+# backend/rate_limiter.py
+# ASCII-only. Async sliding-window rate limiter for upstream APIs.
+#
+# Shared by every coroutine that calls the same provider, so concurrent
+# fetches stay under the provider's per-minute quota instead of relying on
+# fixed sleeps between calls.
+
+import asyncio
+import time
+from collections import deque
+
+
+class AsyncRateLimiter:
+    """Allow at most `max_calls` acquisitions per `period` seconds."""
+
+    def __init__(self, max_calls: int, period: float = 60.0):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls: "deque[float]" = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a slot is free in the current window, then take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.max_calls:
+                    self._calls.append(now)
+                    return
+                await asyncio.sleep(self.period - (now - self._calls[0]))
+
+    async def __aenter__(self) -> "AsyncRateLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        return None
@@ -8,14 +8,82 @@
 # - Fix duplicate _format_sources definition
 # - Safer formatting for numeric fields (volume) and period-aware historical labels
 
+import asyncio
+import math
 import os
-from anthropic import Anthropic
+import time
+import httpx
+from functools import lru_cache
+from itertools import islice
+from anthropic import Anthropic, AsyncAnthropic
 from dotenv import load_dotenv
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import json_utils
+from http_client import HTTP2_ENABLED
+from log_setup import get_logger
+from ttl_cache import TTLCache
 
 load_dotenv()
 
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+logger = get_logger("response_generator")
+
+ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+
+# Created on first use (not at import) and shared, so every analysis reuses
+# the same pooled, HTTP/2-multiplexed connections to the Anthropic API
+_client: Optional[Anthropic] = None
+
+
+def _get_client() -> Anthropic:
+    global _client
+    if _client is None:
+        _client = Anthropic(
+            api_key=ANTHROPIC_API_KEY,
+            http_client=httpx.Client(
+                http2=HTTP2_ENABLED,
+                timeout=httpx.Timeout(60.0, connect=5.0),
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+            ),
+        )
+    return _client
+
+
+# Async twin for the comparison path, awaited directly on the event loop.
+# The semaphore caps in-flight model calls across all sessions.
+MAX_CONCURRENT_MODEL_CALLS = 40
+_async_client: Optional[AsyncAnthropic] = None
+_model_slots = asyncio.Semaphore(MAX_CONCURRENT_MODEL_CALLS)
+
+
+def _get_async_client() -> AsyncAnthropic:
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncAnthropic(
+            api_key=ANTHROPIC_API_KEY,
+            http_client=httpx.AsyncClient(
+                http2=HTTP2_ENABLED,
+                timeout=httpx.Timeout(60.0, connect=5.0),
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+            ),
+        )
+    return _async_client
+
+
+async def aclose_async_client() -> None:
+    """Close the async Anthropic client (called on app shutdown)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+# Generated answers keyed by a digest of everything the prompt depends on
+# (question, tickers, rounded prices, article URLs, confidence). A hit skips
+# the model call; next_actions are always rebuilt. History questions change
+# slowly, so they live longer than quote-driven ones.
+RESPONSE_TTL_SECONDS = 15 * 60
+RESPONSE_TTL_BY_QUERY_TYPE = {"historical_performance": 24 * 3600}
+_response_cache = TTLCache(maxsize=512, ttl=RESPONSE_TTL_SECONDS)
 
 
 # -----------------------------
@@ -36,56 +104,139 @@ def generate_response(
       - default_action_id: action id string
     """
 
-    context = _build_context(intent, stock_data, articles, validation)
-
-    tickers = intent.get("tickers", []) or []
-    ticker = tickers[0] if tickers else intent.get("ticker", "UNKNOWN")
+    # Same model call as the stream, just waiting for the final frame
+    for event in generate_response_stream(intent, stock_data, articles, validation):
+        if event.get("done"):
+            return event["response"]
+    return _analysis_error("stream ended without a result")
 
-    print(f"⏳ Generating analysis for {ticker}...")
 
-    try:
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1500,
-            system=_get_system_prompt(validation.get("confidence_level", "LOW")),
-            messages=[
-                {"role": "user", "content": context}
-            ],
-        )
+def generate_response_stream(
+    intent: Dict[str, Any],
+    stock_data: Dict[str, Any],
+    articles: List[Dict[str, Any]],
+    validation: Dict[str, Any]
+) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming form of generate_response: yields {"delta": text} frames as the
+    model writes, then one {"done": True, "response": {...}} frame holding the
+    generate_response dict (next_actions, sources, tokens_used, ...).
+    A response-cache hit is a single delta with the whole answer.
+    """
 
-        response_text = message.content[0].text
-        print(f"✓ Generated response ({len(response_text)} chars)")
+    ticker = _analysis_ticker(intent)
+    query_type = intent.get("query_type")
+    cache_key = _analysis_key(intent, ticker, stock_data, articles, validation)
+    cached = _response_cache.get(cache_key)
+    # Pure function of intent/ticker: settle it before the model call so
+    # the done frame is ready the moment the stream ends
+    actions = _derive_next_actions(intent, ticker)
+
+    if cached is not None:
+        logger.info("✓ Response cache hit for %s", ticker)
+        tokens_used = {"input": 0, "output": 0}
+        yield {"delta": cached["answer"]}
+    else:
+        logger.info("⏳ Generating analysis for %s...", ticker)
+        context = _build_context(intent, stock_data, articles, validation)
+        try:
+            with _get_client().messages.stream(
+                model="claude-sonnet-4-20250514",
+                max_tokens=1500,
+                system=_cached_system(_get_system_prompt(validation.get("confidence_level", "LOW"))),
+                messages=[
+                    {"role": "user", "content": context}
+                ],
+            ) as stream:
+                for text in stream.text_stream:
+                    yield {"delta": text}
+                message = stream.get_final_message()
+
+            cached = _remember_response(cache_key, query_type, message)
+            logger.info("✓ Generated response (%d chars)", len(cached['answer']))
+            tokens_used = cached["tokens_used"]
+
+        except Exception as e:
+            logger.exception("✗ Failed to generate response: %s", e)
+            yield {"done": True, "response": _analysis_error(e)}
+            return
+
+    yield {"done": True, "response": _analysis_result(intent, ticker, articles, validation, cached["answer"], tokens_used, actions)}
+
+
+def generate_batch_responses(
+    items: List[Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]],
+    poll_seconds: float = 3.0,
+    max_wait_seconds: float = 3600.0,
+) -> List[Dict[str, Any]]:
+    """
+    generate_response for many (intent, stock_data, articles, validation)
+    items through the Message Batches API (half price, but results can take
+    minutes). Blocks until the batch ends; meant for background work such
+    as pre-warming follow-ups, never for a user-facing request.
 
-        next_actions, default_action_id = _derive_next_actions(intent, ticker)
+    Results come back in input order and are stored in the response cache,
+    so a later generate_response for the same inputs is a cache hit.
+    """
 
-        return {
-            "success": True,
-            "answer": response_text,
-            "confidence": validation.get("confidence_level", "LOW"),
-            "confidence_score": validation.get("confidence_score", 0),
-            "badge": validation.get("badge", {"emoji": "🔴", "color": "red", "message": "Low confidence"}),
-            "sources": _format_sources(articles),
-            "ticker": ticker,
-            "query_type": intent.get("query_type"),
-            "next_actions": next_actions,
-            "default_action_id": default_action_id,
-            "tokens_used": {
-                "input": message.usage.input_tokens,
-                "output": message.usage.output_tokens,
+    responses: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    pending: Dict[str, Tuple[int, str]] = {}
+    requests = []
+
+    for i, (intent, stock_data, articles, validation) in enumerate(items):
+        ticker = _analysis_ticker(intent)
+        cache_key = _analysis_key(intent, ticker, stock_data, articles, validation)
+        cached = _response_cache.get(cache_key)
+        if cached is not None:
+            responses[i] = _analysis_result(intent, ticker, articles, validation, cached["answer"], {"input": 0, "output": 0})
+            continue
+        custom_id = f"t-{i}"
+        pending[custom_id] = (i, cache_key)
+        requests.append({
+            "custom_id": custom_id,
+            "params": {
+                "model": "claude-sonnet-4-20250514",
+                "max_tokens": 1500,
+                "system": _cached_system(_get_system_prompt(validation.get("confidence_level", "LOW"))),
+                "messages": [
+                    {"role": "user", "content": _build_context(intent, stock_data, articles, validation)}
+                ],
             },
-        }
-
-    except Exception as e:
-        print(f"✗ Failed to generate response: {e}")
-        return {
-            "success": False,
-            "error": f"Failed to generate analysis: {str(e)}",
-            "confidence": "LOW",
-            "confidence_score": 0,
-        }
-
+        })
 
-def generate_comparison_response(
+    if requests:
+        logger.info("⏳ Submitting batch of %d analyses...", len(requests))
+        try:
+            batches = _get_client().beta.messages.batches
+            batch = batches.create(requests=requests)
+            deadline = time.monotonic() + max_wait_seconds
+            while batch.processing_status != "ended":
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"batch {batch.id} still {batch.processing_status}")
+                time.sleep(poll_seconds)
+                batch = batches.retrieve(batch.id)
+
+            for entry in batches.results(batch.id):
+                i, cache_key = pending[entry.custom_id]
+                intent, stock_data, articles, validation = items[i]
+                if entry.result.type != "succeeded":
+                    responses[i] = _analysis_error(f"batch request {entry.result.type}")
+                    continue
+                cached = _remember_response(cache_key, intent.get("query_type"), entry.result.message)
+                responses[i] = _analysis_result(
+                    intent, _analysis_ticker(intent), articles, validation, cached["answer"], cached["tokens_used"]
+                )
+            logger.info("✓ Batch %s finished", batch.id)
+        except Exception as e:
+            logger.exception("✗ Failed to run batch: %s", e)
+            for i, _ in pending.values():
+                if responses[i] is None:
+                    responses[i] = _analysis_error(e)
+
+    return [r if r is not None else _analysis_error("missing batch result") for r in responses]
+
+
+async def generate_comparison_response(
     intent: Dict[str, Any],
     all_stock_data: Dict[str, Dict[str, Any]],
     all_articles: Dict[str, List[Dict[str, Any]]],
@@ -98,7 +249,6 @@ def generate_comparison_response(
     """
 
     tickers = list(all_stock_data.keys())
-    print(f"⏳ Generating comparison for {', '.join(tickers)}...")
 
     question_text = (
         intent.get("question")
@@ -107,106 +257,79 @@ def generate_comparison_response(
         or f"Compare {', '.join(tickers[:-1])} and {tickers[-1]}"
     )
 
-    context = f"User Question: {question_text}\n\n"
-    context += "---\n\n"
-
-    for t in tickers:
-        stock_data = all_stock_data.get(t, {})
-        articles = all_articles.get(t, [])
-
-        context += f"{t} DATA:\n"
-
-        current = stock_data.get("current", {})
-        if current:
-            context += f"Price: ${current.get('current_price', 'N/A')}\n"
-            context += f"Change: {current.get('change_percent', 'N/A')}%\n"
-            context += f"Volume: {_fmt_int(current.get('volume'))}\n"
-
-        company = stock_data.get("company", {})
-        if company:
-            context += f"Company: {company.get('company_name', 'N/A')}\n"
-            context += f"Sector: {company.get('sector', 'N/A')}\n"
-
-        historical = stock_data.get("historical", {})
-        if historical:
-            context += f"Return: {historical.get('total_return', 'N/A')}%\n"
-            context += f"Range: ${historical.get('low', 'N/A')} - ${historical.get('high', 'N/A')}\n"
-
-        if articles:
-            context += f"Recent articles: {len(articles)} found\n"
-            for a in articles[:2]:
-                context += f"  - {a.get('title','')[:70]}... ({a.get('source','')})\n"
-
-        context += "\n"
-
-    context += f"---\n\nDATA CONFIDENCE: {overall_confidence} ({confidence_score}%)\n"
-    context += "\n\n---\nFORMATTING INSTRUCTION: Use \\n\\n (actual newlines) between each paragraph for readability.\n"
-
-    system_prompt = """You are comparing multiple stocks. Provide a clear, comparative analysis grounded in the data provided.
-
-CRITICAL FORMATTING:
-- Use DOUBLE LINE BREAKS between paragraphs
-- Keep paragraphs to 2-3 sentences max
-- Make it scannable and easy to read
-
-STRUCTURE:
-1) Quick comparison snapshot (price/performance) with concrete numbers
-2) Key differences (business model, sector exposure, valuation sensitivity, catalysts)
-3) Comparative judgment: which looks better for different profiles (risk-seeking vs conservative)
-4) End naturally. Do NOT force a scripted follow-up question.
+    # Keyed on the structured inputs, so a hit never builds the prompt
+    cache_key = _response_key(
+        "comparison",
+        question_text,
+        [_price_fingerprint(t, all_stock_data.get(t) or {}) for t in tickers],
+        [_article_key(a) for t in tickers for a in _dedupe_articles(all_articles.get(t) or ())],
+        overall_confidence,
+    )
+    cached = _response_cache.get(cache_key)
+    if cached is not None:
+        logger.info("✓ Response cache hit for %s comparison", ", ".join(tickers))
+    else:
+        logger.info("⏳ Generating comparison for %s...", ", ".join(tickers))
 
-Guidelines:
-- Be direct and specific
-- Cite numbers and call out what data is missing
-- Reference articles by source when relevant
-"""
+    # Next actions: drill into a ticker, or widen comparison
+    next_actions, default_action_id = _derive_comparison_next_actions(tickers)
 
     try:
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1500,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": context}
-            ],
-        )
+        if cached is None:
+            context = _comparison_context(
+                question_text, tickers, all_stock_data, all_articles, overall_confidence, confidence_score
+            )
+            async with _model_slots:
+                message = await _get_async_client().messages.create(
+                    model="claude-sonnet-4-20250514",
+                    max_tokens=1500,
+                    system=_cached_system(COMPARISON_SYSTEM_PROMPT),
+                    tools=[COMPARISON_TOOL],
+                    tool_choice={"type": "tool", "name": COMPARISON_TOOL["name"]},
+                    messages=[
+                        {"role": "user", "content": context}
+                    ],
+                )
+            cached = _remember_response(cache_key, intent.get("query_type"), message)
+            logger.info("✓ Generated comparison (%d chars)", len(cached['answer']))
+            tokens_used = cached["tokens_used"]
+        else:
+            tokens_used = {"input": 0, "output": 0}
 
-        response_text = message.content[0].text
-        print(f"✓ Generated comparison ({len(response_text)} chars)")
+        response_text = cached["answer"]
 
-        all_sources: List[Dict[str, Any]] = []
-        for t, arts in all_articles.items():
-            for a in (arts or [])[:2]:
-                all_sources.append({
+        # Two per ticker, eight overall; only the kept entries are built
+        all_sources = list(islice(
+            (
+                {
                     "title": f"[{t}] {a.get('title','')}",
                     "source": a.get("source", ""),
                     "url": a.get("url", ""),
                     "date": a.get("date", ""),
-                })
+                }
+                for t, arts in all_articles.items()
+                for a in islice(arts or (), 2)
+            ),
+            8,
+        ))
 
         badge = _confidence_badge(overall_confidence)
 
-        # Next actions: drill into a ticker, or widen comparison
-        next_actions, default_action_id = _derive_comparison_next_actions(tickers)
-
         return {
             "success": True,
             "answer": response_text,
             "confidence": overall_confidence,
             "confidence_score": confidence_score,
             "badge": badge,
-            "sources": all_sources[:8],
+            "sources": all_sources,
             "tickers": tickers,
             "next_actions": next_actions,
             "default_action_id": default_action_id,
-            "tokens_used": {
-                "input": message.usage.input_tokens,
-                "output": message.usage.output_tokens,
-            },
+            "tokens_used": tokens_used,
         }
 
     except Exception as e:
-        print(f"✗ Failed to generate comparison: {e}")
+        logger.exception("✗ Failed to generate comparison: %s", e)
         return {
             "success": False,
             "error": f"Failed to generate comparison: {str(e)}",
@@ -215,54 +338,124 @@ Guidelines:
         }
 
 
+def _comparison_context(
+    question_text: str,
+    tickers: List[str],
+    all_stock_data: Dict[str, Dict[str, Any]],
+    all_articles: Dict[str, List[Dict[str, Any]]],
+    overall_confidence: str,
+    confidence_score: int,
+) -> str:
+    parts = [f"User Question: {question_text}\n\n", "---\n\n"]
+    # Each ticker block lists its first two articles; skip stories a prior
+    # ticker already showed (wire pieces often tag several tickers)
+    seen = set()
+    for t in tickers:
+        fresh = [a for a in _dedupe_articles(all_articles.get(t) or ()) if _article_key(a) not in seen]
+        seen.update(_article_key(a) for a in fresh[:2])
+        parts.append(_ticker_block(t, all_stock_data.get(t, {}), fresh))
+    parts.append(f"---\n\nDATA CONFIDENCE: {overall_confidence} ({confidence_score}%)\n")
+    return "".join(parts)
+
+
+def _ticker_block(t: str, stock_data: Dict[str, Any], articles: List[Dict[str, Any]]) -> str:
+    """One ticker's section of the comparison context."""
+    parts = [f"{t} DATA:\n"]
+
+    current = stock_data.get("current", {})
+    if current:
+        parts.append(f"Price: ${current.get('current_price', 'N/A')}\n")
+        parts.append(f"Change: {current.get('change_percent', 'N/A')}%\n")
+        parts.append(f"Volume: {_fmt_int(current.get('volume'))}\n")
+
+    company = stock_data.get("company", {})
+    if company:
+        parts.append(f"Company: {company.get('company_name', 'N/A')}\n")
+        parts.append(f"Sector: {company.get('sector', 'N/A')}\n")
+
+    historical = stock_data.get("historical", {})
+    if historical:
+        parts.append(f"Return: {historical.get('total_return', 'N/A')}%\n")
+        parts.append(f"Range: ${historical.get('low', 'N/A')} - ${historical.get('high', 'N/A')}\n")
+
+    if articles:
+        parts.append(f"Recent articles: {len(articles)} found\n")
+        for a in articles[:2]:
+            parts.append(f"  - {a.get('title','')[:70]}... ({a.get('source','')})\n")
+
+    parts.append("\n")
+    return "".join(parts)
+
+
 # -----------------------------
 # Context builder
 # -----------------------------
 
+# Articles listed in a prompt; more mostly repeats the same coverage
+MAX_CONTEXT_ARTICLES = 6
+
+
+def _article_key(a: Dict[str, Any]) -> str:
+    return a.get("url") or (a.get("title") or "")[:60]
+
+
+def _dedupe_articles(articles: List[Dict[str, Any]], k: int = MAX_CONTEXT_ARTICLES) -> List[Dict[str, Any]]:
+    """First k articles with a distinct URL (or title prefix when there is no URL)."""
+    seen = set()
+    out = []
+    for a in articles:
+        key = _article_key(a)
+        if key in seen:
+            continue
+        seen.add(key)
+        out.append(a)
+        if len(out) == k:
+            break
+    return out
+
+
+# Question to analyze when the intent carries no user text, by query_type
+_FALLBACK_QUESTIONS = {
+    "current_performance": "How is {t} performing today?",
+    "outlook": "What's the outlook for {t}?",
+    "buy_recommendation": "Should I buy {t}?",
+    "historical_performance": "How has {t} performed historically?",
+}
+
+
 def _build_context(intent: Dict[str, Any], stock_data: Dict[str, Any], articles: List[Dict[str, Any]], validation: Dict[str, Any]) -> str:
-    tickers = intent.get("tickers", []) or []
-    ticker = tickers[0] if tickers else intent.get("ticker", "UNKNOWN")
+    ticker = _analysis_ticker(intent)
 
     # Use the actual user question if available
-    question_text = (
-        intent.get("question")
-        or intent.get("original_question")
-        or intent.get("raw_question")
-    )
+    question_text = _question_text(intent)
     if not question_text:
         # fallback to prior behavior, but still query_type-aware
         query_type = intent.get("query_type", "general")
-        if query_type == "current_performance":
-            question_text = f"How is {ticker} performing today?"
-        elif query_type == "outlook":
-            question_text = f"What's the outlook for {ticker}?"
-        elif query_type == "buy_recommendation":
-            question_text = f"Should I buy {ticker}?"
-        elif query_type == "historical_performance":
-            question_text = f"How has {ticker} performed historically?"
-        else:
-            question_text = f"Analyze {ticker} stock"
+        question_text = _FALLBACK_QUESTIONS.get(query_type, "Analyze {t} stock").format(t=ticker)
 
-    context = f"User Question: {question_text}\n\n---\n\n"
+    parts = [f"User Question: {question_text}\n\n---\n\n"]
+    conf_level = validation.get("confidence_level", "LOW")
+    conf_score = validation.get("confidence_score", 0)
 
     current = stock_data.get("current", {}) or {}
     if current:
-        context += "CURRENT DATA:\n"
-        context += f"Price: ${current.get('current_price', 'N/A')}\n"
-        context += f"Change: {current.get('change', 'N/A')} ({current.get('change_percent', 'N/A')}%)\n"
-        context += f"Volume: {_fmt_int(current.get('volume'))}\n"
-        context += f"Day Range: ${current.get('day_low', 'N/A')} - ${current.get('day_high', 'N/A')}\n\n"
+        parts.append("CURRENT DATA:\n")
+        parts.append(f"Price: ${current.get('current_price', 'N/A')}\n")
+        parts.append(f"Change: {current.get('change', 'N/A')} ({current.get('change_percent', 'N/A')}%)\n")
+        parts.append(f"Volume: {_fmt_int(current.get('volume'))}\n")
+        parts.append(f"Day Range: ${current.get('day_low', 'N/A')} - ${current.get('day_high', 'N/A')}\n\n")
 
     company = stock_data.get("company", {}) or {}
     if company:
-        context += "COMPANY INFO:\n"
-        context += f"Name: {company.get('company_name', 'N/A')}\n"
-        context += f"Sector: {company.get('sector', 'N/A')}\n"
-        context += f"Industry: {company.get('industry', 'N/A')}\n"
-        if company.get("description"):
+        parts.append("COMPANY INFO:\n")
+        parts.append(f"Name: {company.get('company_name', 'N/A')}\n")
+        parts.append(f"Sector: {company.get('sector', 'N/A')}\n")
+        parts.append(f"Industry: {company.get('industry', 'N/A')}\n")
+        # Boilerplate blurb; not worth the tokens on a low-confidence answer
+        if company.get("description") and conf_level != "LOW":
             desc = str(company.get("description"))
-            context += f"Description: {desc[:200]}...\n"
-        context += "\n"
+            parts.append(f"Description: {desc[:200]}...\n")
+        parts.append("\n")
 
     historical = stock_data.get("historical", {}) or {}
     if historical:
@@ -273,40 +466,208 @@ def _build_context(intent: Dict[str, Any], stock_data: Dict[str, Any], articles:
             or intent.get("timeframe")
             or "Past Year"
         )
-        context += f"HISTORICAL PERFORMANCE ({hist_label}):\n"
-        context += f"Total Return: {historical.get('total_return', 'N/A')}%\n"
-        context += f"Range: ${historical.get('low', 'N/A')} - ${historical.get('high', 'N/A')}\n"
-        context += f"Data Points: {historical.get('data_points', 'N/A')}\n\n"
+        parts.append(f"HISTORICAL PERFORMANCE ({hist_label}):\n")
+        parts.append(f"Total Return: {historical.get('total_return', 'N/A')}%\n")
+        parts.append(f"Range: ${historical.get('low', 'N/A')} - ${historical.get('high', 'N/A')}\n")
+        parts.append(f"Data Points: {historical.get('data_points', 'N/A')}\n\n")
 
+    articles = _dedupe_articles(articles or ())
     if articles:
-        context += f"RECENT ANALYSIS & NEWS ({len(articles)} articles):\n"
+        parts.append(f"RECENT ANALYSIS & NEWS ({len(articles)} articles):\n")
         for i, a in enumerate(articles, 1):
-            context += f"\n[{i}] {a.get('title','')}\n"
-            context += f"    Source: {a.get('source','')} ({a.get('date','')})\n"
+            parts.append(f"\n[{i}] {a.get('title','')}\n")
+            parts.append(f"    Source: {a.get('source','')} ({a.get('date','')})\n")
             snip = a.get("snippet")
             if snip:
-                context += f"    {str(snip)[:150]}...\n"
-        context += "\n"
+                parts.append(f"    {str(snip)[:150]}...\n")
+        parts.append("\n")
 
-    context += "---\n\n"
-    conf_level = validation.get("confidence_level", "LOW")
-    conf_score = validation.get("confidence_score", 0)
-    context += f"DATA CONFIDENCE: {conf_level} ({conf_score}%)\n"
+    parts.append("---\n\n")
+    parts.append(f"DATA CONFIDENCE: {conf_level} ({conf_score}%)\n")
 
     missing = validation.get("missing_data") or []
     if missing:
         # keep it short
         preview = ", ".join(str(x) for x in missing[:3])
-        context += f"Missing: {preview}\n"
+        parts.append(f"Missing: {preview}\n")
+
+    parts.append(FORMATTING_INSTRUCTION)
+    return "".join(parts)
+
+
+def _tickers_of(intent: Dict[str, Any]) -> List[str]:
+    """intent["tickers"], falling back to intent["ticker"]; None/missing/"" -> []."""
+    t = intent.get("tickers") or intent.get("ticker")
+    if isinstance(t, str):
+        return [t]
+    return list(t) if t else []
+
+
+def _analysis_ticker(intent: Dict[str, Any]) -> str:
+    tickers = _tickers_of(intent)
+    return tickers[0] if tickers else "UNKNOWN"
+
+
+def _analysis_result(
+    intent: Dict[str, Any],
+    ticker: str,
+    articles: List[Dict[str, Any]],
+    validation: Dict[str, Any],
+    response_text: str,
+    tokens_used: Dict[str, int],
+    actions: Optional[Tuple[List[Dict[str, Any]], str]] = None,
+) -> Dict[str, Any]:
+    next_actions, default_action_id = actions or _derive_next_actions(intent, ticker)
+
+    return {
+        "success": True,
+        "answer": response_text,
+        "confidence": validation.get("confidence_level", "LOW"),
+        "confidence_score": validation.get("confidence_score", 0),
+        "badge": validation.get("badge", _BADGES["LOW"]),
+        "sources": _format_sources(articles),
+        "ticker": ticker,
+        "query_type": intent.get("query_type"),
+        "next_actions": next_actions,
+        "default_action_id": default_action_id,
+        "tokens_used": tokens_used,
+    }
+
+
+def _analysis_error(e: Any) -> Dict[str, Any]:
+    return {
+        "success": False,
+        "error": f"Failed to generate analysis: {str(e)}",
+        "confidence": "LOW",
+        "confidence_score": 0,
+    }
+
+
+def _question_text(intent: Dict[str, Any]) -> Optional[str]:
+    return (
+        intent.get("question")
+        or intent.get("original_question")
+        or intent.get("raw_question")
+    )
+
+
+# -----------------------------
+# Response cache
+# -----------------------------
+
+def _price_fingerprint(ticker: str, stock_data: Dict[str, Any]) -> Tuple[Any, ...]:
+    """The quote fields that move the answer, rounded so tick noise still hits."""
+    current = stock_data.get("current") or {}
+    historical = stock_data.get("historical") or {}
+    return (
+        ticker,
+        _rounded(current.get("current_price")),
+        _rounded(current.get("change_percent")),
+        historical.get("total_return"),
+    )
+
+
+def _rounded(v: Any) -> Any:
+    try:
+        return round(float(v), 2)
+    except (TypeError, ValueError):
+        return None
+
+
+def _analysis_key(
+    intent: Dict[str, Any],
+    ticker: str,
+    stock_data: Dict[str, Any],
+    articles: List[Dict[str, Any]],
+    validation: Dict[str, Any],
+) -> str:
+    return _response_key(
+        intent.get("query_type"),
+        _question_text(intent),
+        [_price_fingerprint(ticker, stock_data)],
+        [_article_key(a) for a in _dedupe_articles(articles or ())],
+        validation.get("confidence_level"),
+    )
+
 
-    context += "\n\n---\nFORMATTING INSTRUCTION: Use \\n\\n (actual newlines) between each paragraph for readability.\n"
-    return context
+def _response_key(query_type: Any, question: Any, prices: List[Tuple[Any, ...]], urls: List[Any], confidence: Any) -> str:
+    parts = (query_type, " ".join(str(question or "").lower().split()), prices, urls, confidence)
+    return json_utils.digest(parts)
+
+
+def _remember_response(cache_key: str, query_type: Any, message: Any) -> Dict[str, Any]:
+    """Cache the answer text and token usage of a fresh model call."""
+    entry = {
+        "answer": _message_text(message),
+        "tokens_used": {
+            "input": message.usage.input_tokens,
+            "output": message.usage.output_tokens,
+        },
+    }
+    _response_cache.set(cache_key, entry, ttl=RESPONSE_TTL_BY_QUERY_TYPE.get(query_type, RESPONSE_TTL_SECONDS))
+    return entry
+
+
+def _message_text(message: Any) -> str:
+    """Answer text of a model reply; tool output is rendered section by section."""
+    for block in message.content:
+        if getattr(block, "type", "text") == "tool_use":
+            sections = (str(block.input.get(k) or "").strip() for k in COMPARISON_SECTIONS)
+            return "\n\n".join(filter(None, sections))
+    return message.content[0].text
 
 
 # -----------------------------
 # System prompt
 # -----------------------------
 
+# Fixed tail of every user message. It stays inline after the per-request
+# data: a cache breakpoint there would only cover the part that changes.
+FORMATTING_INSTRUCTION = "\n\n---\nFORMATTING INSTRUCTION: Use \\n\\n (actual newlines) between each paragraph for readability.\n"
+
+COMPARISON_SYSTEM_PROMPT = """You are comparing multiple stocks. Provide a clear, comparative analysis grounded in the data provided, using the emit_comparison tool.
+
+Guidelines:
+- Be direct and specific
+- Cite numbers and call out what data is missing
+- Reference articles by source when relevant
+- Keep each section to a few short sentences. Do NOT add a scripted follow-up question.
+"""
+
+# Comparisons come back as tool input with one field per section; the server
+# joins them with blank lines, so the prompt carries no formatting rules.
+# Sonnet 4 has token-efficient tool use built in (no beta header needed).
+COMPARISON_SECTIONS = ("snapshot", "differences", "judgment")
+COMPARISON_TOOL = {
+    "name": "emit_comparison",
+    "description": "Return the comparative analysis, one field per section.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "snapshot": {
+                "type": "string",
+                "description": "Quick comparison snapshot (price/performance) with concrete numbers.",
+            },
+            "differences": {
+                "type": "string",
+                "description": "Key differences: business model, sector exposure, valuation sensitivity, catalysts.",
+            },
+            "judgment": {
+                "type": "string",
+                "description": "Which looks better for different profiles (risk-seeking vs conservative).",
+            },
+        },
+        "required": list(COMPARISON_SECTIONS),
+    },
+}
+
+
+def _cached_system(prompt: str) -> List[Dict[str, Any]]:
+    """System prompt as a content block marked for Anthropic prompt caching."""
+    return [{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}]
+
+
+@lru_cache(maxsize=8)
 def _get_system_prompt(confidence_level: str) -> str:
     base_prompt = """You are a private-mode financial analysis assistant. Provide clear, direct stock analysis based on the data provided.
 
@@ -344,6 +705,48 @@ SUGGESTED STRUCTURE (adapt as needed):
 # Next-actions derivation
 # -----------------------------
 
+# (id, label, query, keywords) templates; {t} is the ticker
+_RISK_ACTION = (
+    "deep_dive_key_risks",
+    "Go deeper on {t} risks and what would break the thesis",
+    "Dive deeper into {t}: key risks, main failure modes, and what would change your view.",
+    ("risk", "break", "failure", "downside"),
+)
+_EARNINGS_ACTION = (
+    "deep_dive_earnings",
+    "Dive deeper into {t} earnings and forward drivers",
+    "Dive deeper into {t}: latest earnings takeaways, guidance, and the next 1-2 catalysts that matter.",
+    ("earnings", "guidance", "catalyst", "q4", "quarter"),
+)
+_VALUATION_ACTION = (
+    "valuation_sanity_check",
+    "Run a valuation sanity-check on {t}",
+    "Sanity-check {t} valuation vs growth and risks. What assumptions are priced in?",
+    ("valuation", "pe", "multiple", "priced in"),
+)
+_REGIME_ACTION = (
+    "regime_breakdown",
+    "Break {t} history into regimes (runs, drawdowns, catalysts)",
+    "Break down {t} historical performance into major regimes: run-ups, drawdowns, and what drove each.",
+    ("history", "regime", "drawdown", "cycle"),
+)
+# If TSLA, a very common follow-up is EV valuation compare
+_TSLA_EV_ACTION = (
+    "compare_ev_valuation",
+    "Compare TSLA valuation vs other EV/auto manufacturers",
+    "Compare TSLA valuation metrics and narrative vs major auto/EV peers (GM, F, RIVN, LCID). What looks most mispriced and why?",
+    ("compare", "ev", "peers", "gm", "ford", "rivn", "lcid", "valuation"),
+)
+
+# Action order per query type; the risk deep-dive applies to every analysis
+_QT_ACTIONS = {
+    "outlook": (_EARNINGS_ACTION, _RISK_ACTION, _VALUATION_ACTION),
+    "buy_recommendation": (_EARNINGS_ACTION, _RISK_ACTION, _VALUATION_ACTION),
+    "historical_performance": (_REGIME_ACTION, _RISK_ACTION),
+}
+_DEFAULT_ACTIONS = (_RISK_ACTION,)
+
+
 def _derive_next_actions(intent: Dict[str, Any], ticker: str) -> Tuple[List[Dict[str, Any]], str]:
     """
     Deterministic next actions for follow-up routing.
@@ -353,50 +756,20 @@ def _derive_next_actions(intent: Dict[str, Any], ticker: str) -> Tuple[List[Dict
     qt = (intent.get("query_type") or "general").lower()
     t = (ticker or "UNKNOWN").upper()
 
-    actions: List[Dict[str, Any]] = []
-
-    # Universal options for single-ticker analyses
-    actions.append({
-        "id": "deep_dive_key_risks",
-        "label": f"Go deeper on {t} risks and what would break the thesis",
-        "query": f"Dive deeper into {t}: key risks, main failure modes, and what would change your view.",
-        "keywords": ["risk", "break", "failure", "downside"],
-    })
-
-    # Query-type specific actions
-    if qt in ("outlook", "buy_recommendation"):
-        actions.insert(0, {
-            "id": "deep_dive_earnings",
-            "label": f"Dive deeper into {t} earnings and forward drivers",
-            "query": f"Dive deeper into {t}: latest earnings takeaways, guidance, and the next 1-2 catalysts that matter.",
-            "keywords": ["earnings", "guidance", "catalyst", "q4", "quarter"],
-        })
-        actions.append({
-            "id": "valuation_sanity_check",
-            "label": f"Run a valuation sanity-check on {t}",
-            "query": f"Sanity-check {t} valuation vs growth and risks. What assumptions are priced in?",
-            "keywords": ["valuation", "pe", "multiple", "priced in"],
-        })
-
-    if qt == "historical_performance":
-        actions.insert(0, {
-            "id": "regime_breakdown",
-            "label": f"Break {t} history into regimes (runs, drawdowns, catalysts)",
-            "query": f"Break down {t} historical performance into major regimes: run-ups, drawdowns, and what drove each.",
-            "keywords": ["history", "regime", "drawdown", "cycle"],
-        })
-
-    # If TSLA, a very common follow-up is EV valuation compare
+    templates = _QT_ACTIONS.get(qt, _DEFAULT_ACTIONS)
     if t == "TSLA":
-        actions.append({
-            "id": "compare_ev_valuation",
-            "label": "Compare TSLA valuation vs other EV/auto manufacturers",
-            "query": "Compare TSLA valuation metrics and narrative vs major auto/EV peers (GM, F, RIVN, LCID). What looks most mispriced and why?",
-            "keywords": ["compare", "ev", "peers", "gm", "ford", "rivn", "lcid", "valuation"],
-        })
+        templates = templates + (_TSLA_EV_ACTION,)
 
     # Keep it small: top 3 actions only
-    actions = actions[:3]
+    actions: List[Dict[str, Any]] = [
+        {
+            "id": action_id,
+            "label": label.format(t=t),
+            "query": query.format(t=t),
+            "keywords": list(keywords),
+        }
+        for action_id, label, query, keywords in templates[:3]
+    ]
 
     default_action_id = actions[0]["id"] if actions else "deep_dive_key_risks"
     return actions, default_action_id
@@ -436,35 +809,47 @@ def _derive_comparison_next_actions(tickers: List[str]) -> Tuple[List[Dict[str,
 # -----------------------------
 
 def _format_sources(articles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    sources: List[Dict[str, Any]] = []
-    for a in (articles or [])[:5]:
-        sources.append({
+    return [
+        {
             "title": a.get("title", ""),
             "source": a.get("source", ""),
             "url": a.get("url", ""),
             "date": a.get("date", ""),
-        })
-    return sources
+        }
+        for a in islice(articles or (), 5)
+    ]
+
+
+# Shared, never mutated: responses hand these out by reference
+_BADGES = {
+    "HIGH": {"emoji": "🟢", "color": "green", "message": "High confidence"},
+    "MEDIUM": {"emoji": "🟡", "color": "yellow", "message": "Medium confidence"},
+    "LOW": {"emoji": "🔴", "color": "red", "message": "Low confidence"},
+}
 
 
 def _confidence_badge(conf: str) -> Dict[str, str]:
-    c = (conf or "LOW").upper()
-    if c == "HIGH":
-        return {"emoji": "🟢", "color": "green", "message": "High confidence"}
-    if c == "MEDIUM":
-        return {"emoji": "🟡", "color": "yellow", "message": "Medium confidence"}
-    return {"emoji": "🔴", "color": "red", "message": "Low confidence"}
+    return _BADGES.get((conf or "LOW").upper(), _BADGES["LOW"])
 
 
 def _fmt_int(v: Any) -> str:
-    try:
-        if v is None:
+    # Explicit type dispatch; the common int / None volumes never raise
+    if v is None:
+        return "N/A"
+    if isinstance(v, int):
+        return f"{int(v):,}"
+    if isinstance(v, float):
+        return f"{int(v):,}" if math.isfinite(v) else "N/A"
+    if isinstance(v, str):
+        s = v.replace(",", "").strip()
+        if not s or s.upper() == "N/A":
             return "N/A"
-        if isinstance(v, str):
-            if v.strip().upper() == "N/A":
-                return "N/A"
-            v = float(v.replace(",", ""))
-        iv = int(v)
-        return f"{iv:,}"
-    except Exception:
+        try:
+            f = float(s)
+        except ValueError:
+            return "N/A"
+        return f"{int(f):,}" if math.isfinite(f) else "N/A"
+    try:
+        return f"{int(v):,}"
+    except (TypeError, ValueError, OverflowError):
         return "N/A"
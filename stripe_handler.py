@@ -1,13 +1,37 @@
 # backend/stripe_handler.py
 import os
+import time
 import stripe
 from dotenv import load_dotenv
 
+import json_utils
+from log_setup import get_logger
+from ttl_cache import TTLCache
+
 load_dotenv()
 
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+logger = get_logger("stripe")
+
+# Resolved once at import; the request paths never touch the environment
+STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+if not STRIPE_SECRET_KEY or not STRIPE_WEBHOOK_SECRET:
+    logger.warning("⚠ STRIPE_SECRET_KEY / STRIPE_WEBHOOK_SECRET not set; checkout and webhooks will fail")
+
+stripe.api_key = STRIPE_SECRET_KEY
 STRIPE_PRICE_ID = os.getenv("STRIPE_PRICE_ID", "price_1SxW85J3ZSvE72b5DBpNyf3t")
 
+# A double-clicked subscribe button gets the same open checkout session back
+# instead of a second Stripe round-trip (sessions stay open for 24h)
+CHECKOUT_REUSE_SECONDS = 30 * 60
+_checkout_sessions = TTLCache(maxsize=10000, ttl=CHECKOUT_REUSE_SECONDS)
+
+
+def forget_checkout_session(client_reference_id: str) -> None:
+    """Drop the reusable session once it has been paid."""
+    _checkout_sessions.pop(client_reference_id)
+
+
 def create_checkout_session(success_url: str, cancel_url: str, client_reference_id: str = None):
     """
     Create a Stripe checkout session for monthly subscription.
@@ -20,8 +44,19 @@ def create_checkout_session(success_url: str, cancel_url: str, client_reference_
     Returns:
         Dictionary with checkout session URL
     """
+    if client_reference_id:
+        cached = _checkout_sessions.get(client_reference_id)
+        if cached is not None:
+            return cached
+
+    # Same key within a reuse window, so a retried create can't open a second session
+    idempotency_key = None
+    if client_reference_id:
+        idempotency_key = f"checkout:{client_reference_id}:{int(time.time() // CHECKOUT_REUSE_SECONDS)}"
+
     try:
         session = stripe.checkout.Session.create(
+            idempotency_key=idempotency_key,
             payment_method_types=['card'],
             line_items=[{
                 'price': STRIPE_PRICE_ID,
@@ -33,14 +68,17 @@ def create_checkout_session(success_url: str, cancel_url: str, client_reference_
             client_reference_id=client_reference_id,  # Track which user paid
         )
         
-        return {
+        result = {
             "success": True,
             "checkout_url": session.url,
             "session_id": session.id
         }
+        if client_reference_id:
+            _checkout_sessions.set(client_reference_id, result)
+        return result
     
     except Exception as e:
-        print(f"✗ Stripe checkout error: {e}")
+        logger.error("✗ Stripe checkout error: %s", e)
         return {
             "success": False,
             "error": str(e)
@@ -50,14 +88,17 @@ def create_checkout_session(success_url: str, cancel_url: str, client_reference_
 def verify_webhook(payload: bytes, sig_header: str) -> dict:
     """
     Verify and parse Stripe webhook event.
+    Returns the event as a plain dict: the handler only reads keys from it,
+    so building stripe's OrderedDict-backed Event tree is skipped.
     """
-    webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
-    
     try:
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, webhook_secret
+        # Constant-time signature check on the raw body, then one parse
+        stripe.WebhookSignature.verify_header(
+            payload.decode("utf-8") if isinstance(payload, bytes) else payload,
+            sig_header, STRIPE_WEBHOOK_SECRET, tolerance=stripe.Webhook.DEFAULT_TOLERANCE
         )
+        event = json_utils.loads(payload)
         return {"success": True, "event": event}
     except Exception as e:
-        print(f"✗ Webhook verification failed: {e}")
+        logger.warning("✗ Webhook verification failed: %s", e)
         return {"success": False, "error": str(e)}
\ No newline at end of file
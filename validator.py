@@ -1,16 +1,78 @@
 # backend/validator.py
 
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
+# Score cutoffs for MEDIUM and HIGH; below the first is LOW
+CONFIDENCE_THRESHOLDS = (50, 80)
+CONFIDENCE_LEVELS = ("LOW", "MEDIUM", "HIGH")
 
-def calculate_confidence(stock_data: Dict, articles: List[Dict] = None) -> Tuple[str, int, List[str]]:
+# Built once and shared by every validation result; callers only read them.
+# Plain dicts (not MappingProxyType) because orjson serializes them in the
+# SSE frames.
+CONFIDENCE_BADGES = {
+    "HIGH": {
+        "color": "green",
+        "emoji": "🟢",
+        "message": "High confidence - data is fresh and complete",
+        "css_class": "confidence-high"
+    },
+    "MEDIUM": {
+        "color": "yellow",
+        "emoji": "🟡",
+        "message": "Medium confidence - some data may be incomplete",
+        "css_class": "confidence-medium"
+    },
+    "LOW": {
+        "color": "red",
+        "emoji": "🔴",
+        "message": "Low confidence - data is missing or outdated",
+        "css_class": "confidence-low"
+    }
+}
+
+
+# Price freshness: age cutoffs in seconds (20 min, 1 h, 24 h) and the
+# (points, missing note) for each band between them
+PRICE_AGE_CUTOFFS = (20 * 60, 60 * 60, 24 * 60 * 60)
+PRICE_AGE_TIERS = (
+    (30, None),  # Very fresh
+    (25, None),  # Fresh
+    (18, "Price data is from earlier today"),  # Same day
+    (10, "Price data is over 1 day old"),  # Stale
+)
+
+# Historical depth: more than 5 / more than 20 data points move up a band
+HISTORY_CUTOFFS = (5, 20)
+HISTORY_TIERS = (
+    (5, "Very limited historical data"),
+    (12, "Limited historical data"),
+    (20, None),
+)
+
+# Article coverage by count (3+ uses the last entry)
+ARTICLE_TIERS = (
+    (0, "No recent articles found from trusted sources"),
+    (10, "Very limited article coverage (only 1 article)"),  # Minimal coverage
+    (20, "Limited recent article coverage (only 2 articles)"),  # Good coverage
+    (30, None),  # Excellent coverage
+)
+
+def confidence_level_for(score: int) -> str:
+    """Map a 0-100 confidence score to "LOW", "MEDIUM" or "HIGH"."""
+    return CONFIDENCE_LEVELS[bisect_right(CONFIDENCE_THRESHOLDS, score)]
+
+
+def calculate_confidence(stock_data: Dict, articles: List[Dict] = None, *, now: Optional[datetime] = None) -> Tuple[str, int, List[str]]:
     """
     Calculate confidence level based on data quality, freshness, and article coverage.
     
     Args:
         stock_data: Dictionary from market_data.get_stock_data()
         articles: Optional list of articles from web_search
+        now: Reference time for freshness (defaults to datetime.now()); pass
+            one value when validating several tickers together
         
     Returns:
         Tuple of (level, score, missing_items):
@@ -34,19 +96,13 @@ def calculate_confidence(stock_data: Dict, articles: List[Dict] = None) -> Tuple
         if timestamp:
             try:
                 data_time = datetime.fromisoformat(timestamp)
-                age = datetime.now() - data_time
+                age_seconds = ((now or datetime.now()) - data_time).total_seconds()
                 
-                if age < timedelta(minutes=20):
-                    score += 30  # Very fresh
-                elif age < timedelta(hours=1):
-                    score += 25  # Fresh
-                elif age < timedelta(hours=24):
-                    score += 18  # Same day
-                    missing.append("Price data is from earlier today")
-                else:
-                    score += 10  # Stale
-                    missing.append("Price data is over 1 day old")
-            except:
+                points, note = PRICE_AGE_TIERS[bisect_right(PRICE_AGE_CUTOFFS, age_seconds)]
+                score += points
+                if note:
+                    missing.append(note)
+            except (TypeError, ValueError):
                 score += 20  # Has data but can't verify freshness
         else:
             score += 20  # Has price but no timestamp
@@ -69,31 +125,19 @@ def calculate_confidence(stock_data: Dict, articles: List[Dict] = None) -> Tuple
     # Check historical data (20 points - same as before)
     historical = stock_data.get('historical')
     if historical:
-        if historical.get('data_points', 0) > 20:
-            score += 20
-        elif historical.get('data_points', 0) > 5:
-            score += 12
-            missing.append("Limited historical data")
-        else:
-            score += 5
-            missing.append("Very limited historical data")
+        points, note = HISTORY_TIERS[bisect_left(HISTORY_CUTOFFS, historical.get('data_points', 0))]
+        score += points
+        if note:
+            missing.append(note)
     else:
         missing.append("Historical data not available")
     
     # NEW: Check article coverage (30 points - CRITICAL for analysis)
     if articles is not None:
-        article_count = len(articles)
-        
-        if article_count >= 3:
-            score += 30  # Excellent coverage
-        elif article_count >= 2:
-            score += 20  # Good coverage
-            missing.append("Limited recent article coverage (only 2 articles)")
-        elif article_count >= 1:
-            score += 10  # Minimal coverage
-            missing.append("Very limited article coverage (only 1 article)")
-        else:
-            missing.append("No recent articles found from trusted sources")
+        points, note = ARTICLE_TIERS[min(len(articles), len(ARTICLE_TIERS) - 1)]
+        score += points
+        if note:
+            missing.append(note)
     else:
         # If articles weren't searched, don't penalize
         missing.append("Article search not performed")
@@ -102,97 +146,7 @@ def calculate_confidence(stock_data: Dict, articles: List[Dict] = None) -> Tuple
     score = min(score, 100)
     
     # Determine level
-    if score >= 80:
-        level = "HIGH"
-    elif score >= 50:
-        level = "MEDIUM"
-    else:
-        level = "LOW"
-    
-    return (level, score, missing)
-    """
-    Calculate confidence level based on data quality and freshness.
-    
-    Args:
-        stock_data: Dictionary from market_data.get_stock_data()
-        
-    Returns:
-        Tuple of (level, score, missing_items):
-        - level: "HIGH", "MEDIUM", or "LOW"
-        - score: 0-100 confidence percentage
-        - missing_items: List of what's missing/stale
-    """
-    
-    score = 0
-    missing = []
-    
-    # Start with base score
-    if not stock_data.get('success'):
-        return ("LOW", 0, ["Failed to fetch any data"])
-    
-    # Check current price data (40 points)
-    current = stock_data.get('current')
-    if current and current.get('current_price'):
-        # Check freshness (within 1 hour)
-        timestamp = current.get('timestamp')
-        if timestamp:
-            try:
-                data_time = datetime.fromisoformat(timestamp)
-                age = datetime.now() - data_time
-                
-                if age < timedelta(minutes=20):
-                    score += 40  # Very fresh
-                elif age < timedelta(hours=1):
-                    score += 35  # Fresh
-                elif age < timedelta(hours=24):
-                    score += 25  # Same day
-                    missing.append("Price data is from earlier today")
-                else:
-                    score += 15  # Stale
-                    missing.append("Price data is over 1 day old")
-            except:
-                score += 30  # Has data but can't verify freshness
-        else:
-            score += 30  # Has price but no timestamp
-    else:
-        missing.append("Current price not available")
-    
-    # Check company info (30 points)
-    company = stock_data.get('company')
-    if company and company.get('company_name'):
-        score += 30
-        
-        # Bonus points for rich company data
-        if company.get('description'):
-            score += 5
-        if company.get('sector') and company.get('industry'):
-            score += 5
-    else:
-        missing.append("Company information not available")
-    
-    # Check historical data (20 points) - if requested
-    historical = stock_data.get('historical')
-    if historical:
-        if historical.get('data_points', 0) > 20:
-            score += 20
-        elif historical.get('data_points', 0) > 5:
-            score += 15
-            missing.append("Limited historical data")
-        else:
-            score += 5
-            missing.append("Very limited historical data")
-    # Don't penalize if historical wasn't requested
-    
-    # Cap score at 100
-    score = min(score, 100)
-    
-    # Determine level
-    if score >= 80:
-        level = "HIGH"
-    elif score >= 50:
-        level = "MEDIUM"
-    else:
-        level = "LOW"
+    level = confidence_level_for(score)
     
     return (level, score, missing)
 
@@ -208,77 +162,25 @@ def get_confidence_badge(level: str) -> Dict:
         Dictionary with color, emoji, and message
     """
     
-    badges = {
-        "HIGH": {
-            "color": "green",
-            "emoji": "🟢",
-            "message": "High confidence - data is fresh and complete",
-            "css_class": "confidence-high"
-        },
-        "MEDIUM": {
-            "color": "yellow",
-            "emoji": "🟡",
-            "message": "Medium confidence - some data may be incomplete",
-            "css_class": "confidence-medium"
-        },
-        "LOW": {
-            "color": "red",
-            "emoji": "🔴",
-            "message": "Low confidence - data is missing or outdated",
-            "css_class": "confidence-low"
-        }
-    }
-    
-    return badges.get(level, badges["LOW"])
+    return CONFIDENCE_BADGES.get(level, CONFIDENCE_BADGES["LOW"])
 
 
-def validate_stock_data(stock_data: Dict, articles: List[Dict] = None) -> Dict:
+def validate_stock_data(stock_data: Dict, articles: List[Dict] = None, *, now: Optional[datetime] = None) -> Dict:
     """
     Comprehensive validation of stock data with detailed results.
     
     Args:
         stock_data: Dictionary from market_data.get_stock_data()
         articles: Optional list of articles from web_search
+        now: Reference time for freshness checks (see calculate_confidence)
         
     Returns:
         Validation result dictionary with confidence, badge, and details
     """
     
-    level, score, missing = calculate_confidence(stock_data, articles)
-    badge = get_confidence_badge(level)
-    
-    # Safe get helpers
-    current = stock_data.get('current') or {}
-    company = stock_data.get('company') or {}
-    historical = stock_data.get('historical') or {}
-    
-    result = {
-        "valid": level in ["HIGH", "MEDIUM"],  # Only LOW is considered invalid
-        "confidence_level": level,
-        "confidence_score": score,
-        "badge": badge,
-        "missing_data": missing,
-        "has_current_price": bool(current.get('current_price')),
-        "has_company_info": bool(company.get('company_name')),
-        "has_historical_data": bool(historical.get('data_points')),
-        "has_articles": bool(articles and len(articles) > 0),
-        "article_count": len(articles) if articles else 0,
-        "recommendation": _get_recommendation(level, missing)
-    }
-    
-    return result
-    """
-    Comprehensive validation of stock data with detailed results.
-    
-    Args:
-        stock_data: Dictionary from market_data.get_stock_data()
-        
-    Returns:
-        Validation result dictionary with confidence, badge, and details
-    """
-    
-    level, score, missing = calculate_confidence(stock_data)
+    level, score, missing = calculate_confidence(stock_data, articles, now=now)
     badge = get_confidence_badge(level)
+    article_count = len(articles) if articles else 0
     
     # Safe get helpers
     current = stock_data.get('current') or {}
@@ -294,21 +196,28 @@ def validate_stock_data(stock_data: Dict, articles: List[Dict] = None) -> Dict:
         "has_current_price": bool(current.get('current_price')),
         "has_company_info": bool(company.get('company_name')),
         "has_historical_data": bool(historical.get('data_points')),
+        "has_articles": article_count > 0,
+        "article_count": article_count,
         "recommendation": _get_recommendation(level, missing)
     }
     
     return result
 
 
+RECOMMENDATION_HIGH = "Data quality is excellent. Safe to provide detailed analysis."
+RECOMMENDATION_MEDIUM_PREFIX = "Data is acceptable but incomplete. Consider mentioning: "
+RECOMMENDATION_LOW = "Data quality is too low. Recommend user try again later or check ticker symbol."
+
+
 def _get_recommendation(level: str, missing: List[str]) -> str:
     """Generate a recommendation based on confidence level"""
     
     if level == "HIGH":
-        return "Data quality is excellent. Safe to provide detailed analysis."
+        return RECOMMENDATION_HIGH
     elif level == "MEDIUM":
-        return f"Data is acceptable but incomplete. Consider mentioning: {', '.join(missing[:2])}"
+        return RECOMMENDATION_MEDIUM_PREFIX + ", ".join(missing[:2])
     else:
-        return "Data quality is too low. Recommend user try again later or check ticker symbol."
+        return RECOMMENDATION_LOW
 
 
 if __name__ == "__main__":
@@ -1,18 +1,26 @@
 # backend/web_search.py
 
 import os
+import re
+import sys
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from functools import lru_cache
+from types import MappingProxyType
+from typing import List, Dict, Optional, Tuple
+import httpx
+import requests
 from dotenv import load_dotenv
-import sys
-from pathlib import Path
 
 # Load environment
 load_dotenv()
 
-# Import database for caching
-sys.path.append(str(Path(__file__).parent))
+# Sibling modules resolve from the backend directory (the app's working
+# directory / script dir), so no sys.path patching is needed here
+import json_utils
 from database import get_cached_data, cache_data
+from http_client import get_async_client, get_session
+from ttl_cache import TTLCache
 
 # Trusted financial sources (expanded list)
 TRUSTED_DOMAINS = [
@@ -30,6 +38,48 @@ TRUSTED_DOMAINS = [
     "investors.com"
 ]
 
+# Display name per trusted domain
+SOURCE_MAP = MappingProxyType({
+    "seekingalpha.com": "Seeking Alpha",
+    "bloomberg.com": "Bloomberg",
+    "reuters.com": "Reuters",
+    "wsj.com": "Wall Street Journal",
+    "ft.com": "Financial Times",
+    "marketwatch.com": "MarketWatch",
+    "cnbc.com": "CNBC",
+    "barrons.com": "Barron's",
+    "fool.com": "The Motley Fool",
+    "morningstar.com": "Morningstar",
+    "benzinga.com": "Benzinga",
+    "investors.com": "Investor's Business Daily"
+})
+
+# Host is a trusted domain or one of its subdomains (so "microsoft.com"
+# no longer passes as ft.com); group 1 is the matched domain
+DOMAIN_RE = re.compile(
+    r"https?://(?:[^/?#]+\.)?(" + "|".join(re.escape(d) for d in TRUSTED_DOMAINS) + r")(?=[:/?#]|$)",
+    re.IGNORECASE,
+)
+
+# Search restricted to trusted domains with OR'd site: filters; top 5 only
+# to keep the query reasonable
+_DOMAIN_QUERY = "(" + " OR ".join(f"site:{domain}" for domain in TRUSTED_DOMAINS[:5]) + ")"
+
+# Brave Search API endpoint
+BRAVE_SEARCH_URL = "https://api.search.brave.com/res/v1/web/search"
+
+# Resolved once at import; the "your_key_here" placeholder counts as unset
+BRAVE_API_KEY = os.getenv("BRAVE_API_KEY") or ""
+BRAVE_CONFIGURED = bool(BRAVE_API_KEY) and BRAVE_API_KEY != "your_key_here"
+
+# Newest article at most 3 whole days old (under 4 days) counts as recent
+RECENT_ARTICLE_SECONDS = 4 * 86400
+
+# In-process copy of recent searches in front of the SQLite cache, so repeat
+# lookups within 15 minutes skip the DB read and JSON decode
+ARTICLES_MEMORY_TTL_SECONDS = 900
+_articles_memory = TTLCache(maxsize=256, ttl=ARTICLES_MEMORY_TTL_SECONDS)
+
 
 def search_stock_articles(ticker: str, days_back: int = 7, max_results: int = 5) -> List[Dict]:
     """
@@ -46,48 +96,133 @@ def search_stock_articles(ticker: str, days_back: int = 7, max_results: int = 5)
     """
     
     ticker = ticker.upper()
-    cache_key = f"articles_{days_back}days"
+    cache_key = _articles_cache_key(days_back)
     
     # Check cache (7 day freshness for articles)
-    cached = get_cached_data(ticker, cache_key)
-    if cached:
-        print(f"✓ Cache hit: {ticker} articles")
-        return cached.get('articles', [])
+    cached = _cached_articles(ticker, cache_key)
+    if cached is not None:
+        return cached
     
     print(f"⏳ Searching for {ticker} articles (last {days_back} days)...")
     
     # Try real search first, fall back to mock if unavailable
-    brave_api_key = os.getenv("BRAVE_API_KEY")
-    
-    if brave_api_key and brave_api_key != "your_key_here":
-        articles = _brave_search(ticker, days_back, max_results, brave_api_key)
+    if BRAVE_CONFIGURED:
+        articles = _brave_search(ticker, days_back, max_results, BRAVE_API_KEY)
     else:
         print("⚠ BRAVE_API_KEY not configured, using mock data")
         articles = _mock_article_search(ticker, days_back, max_results)
     
     # Cache the results
-    cache_data(ticker, cache_key, {"articles": articles, "count": len(articles)})
+    _store_articles(ticker, cache_key, articles)
+    
+    print(f"✓ Found {len(articles)} articles for {ticker}")
+    return articles
+
+
+async def search_stock_articles_async(ticker: str, days_back: int = 7, max_results: int = 5) -> List[Dict]:
+    """Async variant of search_stock_articles (same cache, non-blocking HTTP)."""
+    
+    ticker = ticker.upper()
+    cache_key = _articles_cache_key(days_back)
+    
+    cached = _cached_articles(ticker, cache_key)
+    if cached is not None:
+        return cached
+    
+    print(f"⏳ Searching for {ticker} articles (last {days_back} days)...")
+    
+    if BRAVE_CONFIGURED:
+        articles = await _brave_search_async(ticker, days_back, max_results, BRAVE_API_KEY)
+    else:
+        print("⚠ BRAVE_API_KEY not configured, using mock data")
+        articles = _mock_article_search(ticker, days_back, max_results)
+    
+    _store_articles(ticker, cache_key, articles)
     
     print(f"✓ Found {len(articles)} articles for {ticker}")
     return articles
 
 
+@lru_cache(maxsize=32)
+def _articles_cache_key(days_back: int) -> str:
+    """Cache key per lookback window, built once and interned so the memory
+    cache's tuple keys compare by identity on the hot path."""
+    return sys.intern(f"articles_{days_back}days")
+
+
+def _cached_articles(ticker: str, cache_key: str) -> Optional[List[Dict]]:
+    """Articles from memory, then SQLite; None on a miss."""
+    
+    articles = _articles_memory.get((ticker, cache_key))
+    if articles is not None:
+        print(f"✓ Cache hit: {ticker} articles")
+        return articles
+    
+    cached = get_cached_data(ticker, cache_key)
+    if cached:
+        print(f"✓ Cache hit: {ticker} articles")
+        articles = cached.get('articles', [])
+        _articles_memory.set((ticker, cache_key), articles)
+        return articles
+    return None
+
+
+def _store_articles(ticker: str, cache_key: str, articles: List[Dict]) -> None:
+    cache_data(ticker, cache_key, {"articles": articles, "count": len(articles)})
+    _articles_memory.set((ticker, cache_key), articles)
+
+
 def _brave_search(ticker: str, days_back: int, max_results: int, api_key: str) -> List[Dict]:
     """
     Real Brave Search API implementation.
     Searches trusted financial domains for stock analysis.
     """
     
-    import requests
-    from urllib.parse import quote
+    headers, params = _brave_request(ticker, days_back, max_results, api_key)
     
-    # Build search query targeting trusted domains
-    # Use OR to search multiple domains
-    domain_query = " OR ".join([f"site:{domain}" for domain in TRUSTED_DOMAINS[:5]])  # Limit to top 5 to keep query reasonable
-    search_query = f"({domain_query}) {ticker} stock analysis"
+    try:
+        response = get_session().get(BRAVE_SEARCH_URL, headers=headers, params=params, timeout=10)
+        response.raise_for_status()
+        
+        return _parse_brave_results(json_utils.loads(response.content), max_results)
+        
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code == 429:
+            print("⚠ Brave API rate limit hit, using mock data")
+        else:
+            print(f"⚠ Brave API error: {e}, using mock data")
+        return _mock_article_search(ticker, days_back, max_results)
+    except Exception as e:
+        print(f"⚠ Search failed: {e}, using mock data")
+        return _mock_article_search(ticker, days_back, max_results)
+
+
+async def _brave_search_async(ticker: str, days_back: int, max_results: int, api_key: str) -> List[Dict]:
+    """Async variant of _brave_search on the shared httpx client."""
+    
+    headers, params = _brave_request(ticker, days_back, max_results, api_key)
+    
+    try:
+        response = await get_async_client().get(BRAVE_SEARCH_URL, headers=headers, params=params)
+        response.raise_for_status()
+        
+        return _parse_brave_results(json_utils.loads(response.content), max_results)
+        
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 429:
+            print("⚠ Brave API rate limit hit, using mock data")
+        else:
+            print(f"⚠ Brave API error: {e}, using mock data")
+        return _mock_article_search(ticker, days_back, max_results)
+    except Exception as e:
+        print(f"⚠ Search failed: {e}, using mock data")
+        return _mock_article_search(ticker, days_back, max_results)
+
+
+def _brave_request(ticker: str, days_back: int, max_results: int, api_key: str) -> Tuple[Dict, Dict]:
+    """Headers and query params for a Brave search."""
     
-    # Brave Search API endpoint
-    url = "https://api.search.brave.com/res/v1/web/search"
+    search_query = f"{_DOMAIN_QUERY} {ticker} stock analysis"
     
     headers = {
         "Accept": "application/json",
@@ -101,65 +236,60 @@ def _brave_search(ticker: str, days_back: int, max_results: int, api_key: str) -
         "freshness": f"pw" if days_back <= 7 else f"pm"  # pw = past week, pm = past month
     }
     
-    try:
-        response = requests.get(url, headers=headers, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        articles = []
-        web_results = data.get('web', {}).get('results', [])
-        
-        for result in web_results[:max_results]:
-            # Extract domain from URL
-            url_str = result.get('url', '')
-            domain = None
-            for trusted_domain in TRUSTED_DOMAINS:
-                if trusted_domain in url_str:
-                    domain = trusted_domain
-                    break
-            
-            if not domain:
-                continue  # Skip non-trusted sources
-            
-            # Get source name from domain
-            source_map = {
-                "seekingalpha.com": "Seeking Alpha",
-                "bloomberg.com": "Bloomberg",
-                "reuters.com": "Reuters",
-                "wsj.com": "Wall Street Journal",
-                "ft.com": "Financial Times",
-                "marketwatch.com": "MarketWatch",
-                "cnbc.com": "CNBC",
-                "barrons.com": "Barron's",
-                "fool.com": "The Motley Fool",
-                "morningstar.com": "Morningstar",
-                "benzinga.com": "Benzinga",
-                "investors.com": "Investor's Business Daily"
-            }
-            
-            articles.append({
-                "title": result.get('title', 'Untitled'),
-                "source": source_map.get(domain, domain),
-                "domain": domain,
-                "url": url_str,
-                "date": result.get('age', 'Recent'),  # Brave returns relative dates
-                "snippet": result.get('description', ''),
-                "is_trusted": True
-            })
-        
-        print(f"✓ Brave Search returned {len(articles)} trusted articles")
-        return articles
+    return headers, params
+
+
+def _parse_brave_results(data: Dict, max_results: int) -> List[Dict]:
+    """Keep only trusted-domain results from a Brave response."""
+    
+    articles = []
+    web_results = data.get('web', {}).get('results', [])
+    
+    for result in web_results[:max_results]:
+        # Extract domain from URL
+        url_str = result.get('url', '')
+        m = DOMAIN_RE.match(url_str)
+        if not m:
+            continue  # Skip non-trusted sources
+        domain = m.group(1).lower()
         
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 429:
-            print("⚠ Brave API rate limit hit, using mock data")
-        else:
-            print(f"⚠ Brave API error: {e}, using mock data")
-        return _mock_article_search(ticker, days_back, max_results)
-    except Exception as e:
-        print(f"⚠ Search failed: {e}, using mock data")
-        return _mock_article_search(ticker, days_back, max_results)
+        articles.append({
+            "title": result.get('title', 'Untitled'),
+            "source": SOURCE_MAP.get(domain, domain),
+            "domain": domain,
+            "url": url_str,
+            "date": result.get('age', 'Recent'),  # Brave returns relative dates
+            "date_epoch": _iso_epoch(result.get('page_age')),
+            "snippet": result.get('description', ''),
+            "is_trusted": True
+        })
+    
+    print(f"✓ Brave Search returned {len(articles)} trusted articles")
+    return articles
+
+
+def _iso_epoch(value: Optional[str]) -> Optional[int]:
+    """Unix seconds for an ISO timestamp such as Brave's page_age; None if absent/unparseable."""
+    if not value:
+        return None
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def _article_epoch(article: Dict) -> Optional[int]:
+    """Publish time in Unix seconds; parses "date" only for payloads cached before date_epoch existed."""
+    epoch = article.get('date_epoch')
+    if epoch is not None:
+        return epoch
+    d = article.get('date')
+    if not d:
+        return None
+    try:
+        return int(datetime.strptime(d, "%Y-%m-%d").timestamp())
+    except (TypeError, ValueError):
+        return None  # Brave gives relative ages ("2 days ago")
 
 
 def _mock_article_search(ticker: str, days_back: int, max_results: int) -> List[Dict]:
@@ -218,6 +348,7 @@ def _mock_article_search(ticker: str, days_back: int, max_results: int) -> List[
                 "domain": template["domain"],
                 "url": f"https://{template['domain']}/article/{ticker.lower()}-analysis",
                 "date": article_date.strftime("%Y-%m-%d"),
+                "date_epoch": int(article_date.timestamp()),
                 "snippet": f"Recent analysis of {ticker} covering market trends, fundamental analysis, and price targets.",
                 "is_trusted": True
             })
@@ -246,28 +377,30 @@ def get_article_summary(ticker: str, articles: List[Dict]) -> Dict:
             "sources": []
         }
     
-    # Calculate metrics
-    trusted_count = sum(1 for a in articles if a.get('is_trusted', False))
-    sources = list(set(a.get('source', 'Unknown') for a in articles))
+    # One pass: trusted count, distinct sources, and the newest dated article
+    # (results aren't guaranteed to be sorted by date)
+    trusted_count = 0
+    sources = set()
+    newest_date = None
+    newest_epoch = None
+    for a in articles:
+        if a.get('is_trusted'):
+            trusted_count += 1
+        sources.add(a.get('source', 'Unknown'))
+        epoch = _article_epoch(a)
+        if epoch is not None and (newest_epoch is None or epoch > newest_epoch):
+            newest_epoch = epoch
+            newest_date = a.get('date')
     
     # Check recency (within 3 days = "recent")
-    newest = articles[0] if articles else None
-    has_recent = False
-    
-    if newest and newest.get('date'):
-        try:
-            article_date = datetime.strptime(newest['date'], "%Y-%m-%d")
-            days_old = (datetime.now() - article_date).days
-            has_recent = days_old <= 3
-        except:
-            pass
+    has_recent = newest_epoch is not None and time.time() - newest_epoch < RECENT_ARTICLE_SECONDS
     
     return {
         "count": len(articles),
         "has_recent": has_recent,
         "trusted_sources": trusted_count,
-        "newest_date": newest.get('date') if newest else None,
-        "sources": sources
+        "newest_date": newest_date,
+        "sources": list(sources)
     }
 
 